@@ -0,0 +1,216 @@
+"""
+Per-route admission control and load shedding.
+
+Every route belongs to a priority class (ADMISSION_ROUTES; unlisted routes
+are critical). Critical routes (checkout, search) are always admitted, even
+if they have a limit. Best-effort routes (reports, AI) always need a slot
+from the class-wide ADMISSION_BEST_EFFORT_LIMIT, shared by ALL gunicorn
+workers, plus one from their own ADMISSION_LIMITS entry if they have one. A
+waiting request still occupies a sync worker, so the wait queue is also
+class-wide and defaults to 0 (reject immediately). Once the slots are taken
+the request gets a fast 503 with Retry-After.
+
+init_admission() refuses to start unless best-effort limit + queue size is
+below the worker count (WEB_CONCURRENCY, also used by gunicorn.conf.py), so
+at least one worker is always free for create_sale.
+
+Slots are flock()ed files under ADMISSION_DIR: they work across processes and
+threads, and the kernel releases them if a worker dies mid-request. Each
+worker also writes its counters there (at most once a second), and
+/api/admission/stats sums them over all workers.
+"""
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, jsonify, request
+
+CRITICAL = 'critical'
+BEST_EFFORT = 'best_effort'
+
+POLL_INTERVAL = 0.02
+METRICS_FLUSH_INTERVAL = 1.0
+
+
+class SlotPool:
+    """N cross-process slots backed by lock files"""
+
+    def __init__(self, directory, name, size):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"{name}.{i}.lock") for i in range(size)]
+
+    def try_acquire(self):
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @staticmethod
+    def release(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class AdmissionController:
+    def __init__(self, app):
+        config = app.config
+        self.routes = config['ADMISSION_ROUTES']
+        self.queue_timeout = config['ADMISSION_QUEUE_TIMEOUT']
+        self.retry_after = config['ADMISSION_RETRY_AFTER']
+        self.directory = config['ADMISSION_DIR']
+        # Per-route limits only apply to best-effort routes; critical ones are never gated
+        self.running = {}
+        for endpoint, limit in config['ADMISSION_LIMITS'].items():
+            if self.priority(endpoint) == BEST_EFFORT:
+                name = endpoint.replace('.', '_')
+                self.running[endpoint] = SlotPool(self.directory, f"{name}.run", limit)
+        # Class-wide: all best-effort routes together, running and waiting
+        self.best_effort = SlotPool(self.directory, f"{BEST_EFFORT}.run",
+                                    config['ADMISSION_BEST_EFFORT_LIMIT'])
+        self.waiting = SlotPool(self.directory, f"{BEST_EFFORT}.queue", config['ADMISSION_QUEUE_SIZE'])
+
+        # This process's counters, flushed to ADMISSION_DIR for snapshot()
+        self._lock = threading.Lock()
+        self.metrics = defaultdict(lambda: defaultdict(float))
+        self._flushed = 0.0
+
+    def _count(self, endpoint, key, amount=1):
+        with self._lock:
+            self.metrics[endpoint][key] += amount
+            if time.monotonic() - self._flushed >= METRICS_FLUSH_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        """Write this worker's counters (caller holds self._lock)"""
+        path = os.path.join(self.directory, f"metrics.{os.getpid()}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.metrics, f)
+        os.replace(path + '.tmp', path)
+        self._flushed = time.monotonic()
+
+    def priority(self, endpoint):
+        return self.routes.get(endpoint, CRITICAL)
+
+    def _try_admit(self, endpoint):
+        """The route slot (if the route has a limit) and a class slot, or neither"""
+        slots = ()
+        if endpoint in self.running:
+            route_fd = self.running[endpoint].try_acquire()
+            if route_fd is None:
+                return None
+            slots = (route_fd,)
+        class_fd = self.best_effort.try_acquire()
+        if class_fd is None:
+            for fd in slots:
+                SlotPool.release(fd)
+            return None
+        return slots + (class_fd,)
+
+    def admit(self, endpoint):
+        """Return the held slots, or None when the request must be shed"""
+        slots = self._try_admit(endpoint)
+        if slots is not None:
+            self._count(endpoint, 'admitted')
+            return slots
+
+        # Full: wait in the bounded queue, or reject straight away if that's full too
+        queue_fd = self.waiting.try_acquire()
+        if queue_fd is None:
+            self._count(endpoint, 'rejected')
+            return None
+
+        self._count(endpoint, 'queued')
+        started = time.monotonic()
+        try:
+            while time.monotonic() - started < self.queue_timeout:
+                time.sleep(POLL_INTERVAL)
+                slots = self._try_admit(endpoint)
+                if slots is not None:
+                    self._count(endpoint, 'admitted')
+                    self._count(endpoint, 'queue_wait_seconds', time.monotonic() - started)
+                    return slots
+            self._count(endpoint, 'timed_out')
+            return None
+        finally:
+            SlotPool.release(queue_fd)
+
+    def snapshot(self):
+        """Counters summed over every worker that has written them (up to a second behind)"""
+        with self._lock:
+            self._flush()
+        totals = defaultdict(lambda: defaultdict(float))
+        pids = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics.*.json')):
+            try:
+                with open(path) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pids.append(int(path.split('.')[-2]))
+            for endpoint, counters in worker.items():
+                for key, value in counters.items():
+                    totals[endpoint][key] += value
+        return {
+            'workers': sorted(pids),
+            'best_effort_limit': len(self.best_effort.paths),
+            'queue_size': len(self.waiting.paths),
+            'routes': {
+                endpoint: {
+                    'priority': self.priority(endpoint),
+                    'limit': len(self.running[endpoint].paths) if endpoint in self.running else None,
+                    **{key: round(value, 3) for key, value in counters.items()},
+                }
+                for endpoint, counters in totals.items()
+            },
+        }
+
+
+def _overloaded(retry_after):
+    response = jsonify({'success': False, 'error': 'Server busy, please retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def check_capacity(config):
+    """Best-effort requests (running or queued) must never take every worker"""
+    reserved = config['ADMISSION_BEST_EFFORT_LIMIT'] + config['ADMISSION_QUEUE_SIZE']
+    if reserved >= config['WEB_CONCURRENCY']:
+        raise RuntimeError(
+            f"ADMISSION_BEST_EFFORT_LIMIT + ADMISSION_QUEUE_SIZE ({reserved}) must be below "
+            f"WEB_CONCURRENCY ({config['WEB_CONCURRENCY']}) so checkout always has a free worker")
+
+
+def init_admission(app):
+    check_capacity(app.config)
+    controller = AdmissionController(app)
+    app.extensions['admission'] = controller
+
+    @app.before_request
+    def admission_check():
+        endpoint = request.endpoint
+        if controller.priority(endpoint) != BEST_EFFORT:
+            if endpoint and endpoint != 'static':
+                controller._count(endpoint, 'admitted')
+            return None
+
+        slots = controller.admit(endpoint)
+        if slots is None:
+            return _overloaded(controller.retry_after)
+        g.admission_slots = slots
+        return None
+
+    @app.teardown_request
+    def admission_release(exc):
+        for fd in g.pop('admission_slots', ()):
+            SlotPool.release(fd)
+
+    return controller
@@ -1,60 +1,188 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from groq import Groq
+from flask import Blueprint, Flask, after_this_request, current_app, render_template, request, redirect, url_for, session, flash, jsonify
 import json
 from datetime import datetime  
 
-# 🔧 RAILWAY FIX: Use PyMySQL instead of native MySQL driver
-import pymysql
-pymysql.install_as_MySQLdb()
-
-from flask_mysqldb import MySQL
 from config import Config
 from dotenv import load_dotenv
-import MySQLdb.cursors
 import re
 import os
 
-
-load_dotenv()
-
-# Ensure there are NO spaces inside the quotes
-client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-
-# Initialize app
-app = Flask(__name__)
-app.config.from_object(Config)
-
-
-# Setup MySQL
-mysql = MySQL(app)
+import queries
+from admission import init_admission
+from catalog import CatalogSnapshot, apply_stock, is_stale, rebuild as rebuild_catalog, rebuild_if_stale
+from outbox import init_outbox, lag_metrics, publish
+from partitions import register_cli
+from receipts import ReceiptCache, render_receipts, render_receipts_between
+from sketches import WINDOWS, TopKTracker, window_start
+from stocktake import MODES, StocktakeError, parse_sheet, run_stocktake
+from storage import db
+
+
+# Extensions are created unbound and attached in create_app(); nothing here
+# opens a connection or imports the Groq/httpx stack.
+bp = Blueprint('main', __name__)
+
+
+# ---------- APP FACTORY ----------
+def create_app(config_object=Config):
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+
+    # MySQL (default) or embedded SQLite, chosen by DB_BACKEND
+    db.init_app(app)
+    app.register_blueprint(bp)
+
+    # Shed best-effort routes (reports, AI) before they starve checkout
+    init_admission(app)
+
+    # flask partitions init / maintain / archive / export
+    register_cli(app)
+
+    # Alerts, rollups and notifications run after checkout commits
+    init_outbox(app)
+
+    # Completed receipts never change, so render once and reuse
+    app.extensions['receipt_cache'] = ReceiptCache(app.config['RECEIPT_CACHE_SIZE'],
+                                                   app.config['RECEIPT_CACHE_DIR'])
+    # Approximate top sellers per hour, merged into windows on read
+    app.extensions['topk'] = TopKTracker(app.config['TOPK_CAPACITY'], app.config['TOPK_EXACT'],
+                                         app.config['TOPK_REFRESH_SECONDS'])
+    # mmap()ed product catalog shared by all workers on this host
+    app.extensions['catalog'] = CatalogSnapshot(app.config['CATALOG_PATH'])
+    return app
+
+def reset_after_fork(app):
+    """Drop per-process clients inherited from a preloaded gunicorn master"""
+    app.extensions.pop('groq', None)
+
+def get_ai_client():
+    """Groq client, built on first use so workers that never call AI skip the import"""
+    client = current_app.extensions.get('groq')
+    if client is None:
+        from groq import Groq
+        # Ensure there are NO spaces inside the quotes
+        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+        current_app.extensions['groq'] = client
+    return client
+
+def get_receipt_cache():
+    return current_app.extensions['receipt_cache']
+
+def after_response(fn):
+    """Run fn(cursor) on this worker once the response has been sent, reusing the request's connection"""
+    app = current_app._get_current_object()
+
+    @after_this_request
+    def defer(response):
+        conn = db.detach()
+
+        def run():
+            with app.app_context():
+                db.attach(conn)
+                try:
+                    fn(db.cursor())
+                except Exception as e:
+                    print(f"Deferred work error: {str(e)}")
+
+        response.call_on_close(run)
+        return response
 
 # ---------- HELPER FUNCTIONS ----------
 def get_categories():
     """Get all categories from database"""
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     cursor.execute("SELECT * FROM categories ORDER BY name")
     return cursor.fetchall()
 
-@app.context_processor
+def db_now(cursor):
+    """The database's clock: sale timestamps and CURDATE() filters use it, not the app server's"""
+    cursor.execute("SELECT NOW() as now")
+    now = cursor.fetchone()['now']
+    if isinstance(now, str):  # SQLite returns text
+        now = datetime.fromisoformat(now)
+    return now
+
+def top_selling(cursor, window, k, now=None):
+    """Top-k products for a window as (rows, error_bound); rows carry name/prices/total_sold
+    and revenue/profit summed from sale_items. Window boundaries follow db_now()"""
+    now = now or db_now(cursor)
+    if current_app.config['TOPK_MODE'] == 'sql':
+        cursor.execute(*queries.top_products_query(window_start(window, now), k))
+        return cursor.fetchall(), 0
+
+    tracker = current_app.extensions['topk']
+    tracker.refresh(cursor)
+    ranked, error_bound = tracker.top(window, k, now)
+    if not ranked:
+        return [], error_bound
+
+    ids = [r['product_id'] for r in ranked]
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"""
+        SELECT p.id, p.name, p.selling_price, p.purchase_price, c.name as category_name
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id IN ({placeholders})
+    """, tuple(ids))
+    products = {p['id']: p for p in cursor.fetchall()}
+    # Revenue / profit from the sale lines themselves (one grouped query)
+    cursor.execute(*queries.product_totals_query(window_start(window, now), ids))
+    totals = {t['id']: t for t in cursor.fetchall()}
+    rows = []
+    for r in ranked:
+        product = products.get(r['product_id'], {'id': r['product_id'], 'name': 'Deleted Product',
+                                                 'selling_price': 0, 'purchase_price': 0})
+        sold = totals.get(r['product_id'], {})
+        rows.append({**product, 'total_sold': r['count'], 'error': r['error'],
+                     'revenue': sold.get('revenue') or 0, 'profit': sold.get('profit') or 0})
+    return rows, error_bound
+
+def get_catalog(cursor):
+    """The shared catalog snapshot, (re)built from the database if missing or stale"""
+    catalog = current_app.extensions['catalog']
+    path = current_app.config['CATALOG_PATH']
+    # Age of the last full rebuild, not the file mtime: stock patches touch the file
+    if is_stale(path, current_app.config['CATALOG_MAX_AGE']):
+        # Workers that notice together queue here; only the first one rebuilds
+        rebuild_if_stale(cursor, path, current_app.config['CATALOG_MAX_AGE'])
+        return catalog.refresh(force=True)
+    return catalog.refresh()
+
+def catalog_changed(cursor, product_ids=None):
+    """Call after commit: patch stock for product_ids, or rebuild everything"""
+    path = current_app.config['CATALOG_PATH']
+    try:
+        if product_ids and apply_stock(path, cursor, product_ids):
+            return
+        rebuild_catalog(cursor, path)
+    except Exception as e:
+        # A stale snapshot is worse than none: readers rebuild a missing file
+        print(f"Catalog snapshot error: {str(e)}")
+        if os.path.exists(path):
+            os.remove(path)
+
+@bp.app_context_processor
 def inject_categories():
     return dict(get_categories=get_categories)
 
 
 # ---------- ROUTES ----------
-@app.route('/')
+@bp.route('/')
 def home():
     if 'loggedin' in session:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('login.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
         # Check against database
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = db.cursor()
         cursor.execute('SELECT * FROM users WHERE username = %s AND password = %s', (username, password))
         account = cursor.fetchone()
         
@@ -64,24 +192,24 @@ def login():
             session['username'] = account['username']
             session['role'] = account['role']
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             flash('Invalid username or password', 'error')
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
     flash('Logged out successfully', 'info')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     if 'loggedin' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     
     # 1. Total Products Count
     cursor.execute("SELECT COUNT(*) as count FROM products")
@@ -92,29 +220,19 @@ def dashboard():
     low_stock = cursor.fetchone()['count']
     
     # 3. Today's Sales Revenue
-    cursor.execute("SELECT COALESCE(SUM(total_amount), 0) as total FROM sales WHERE DATE(created_at) = CURDATE()")
+    cursor.execute("SELECT COALESCE(SUM(total_amount), 0) as total FROM sales WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY")
     today_sales = float(cursor.fetchone()['total'])
     
     # 4. Today's Profit Calculation
     cursor.execute("""
-        SELECT COALESCE(SUM((si.unit_price - p.purchase_price) * si.quantity), 0) as profit
-        FROM sale_items si
-        JOIN products p ON si.product_id = p.id
-        JOIN sales s ON si.sale_id = s.id
-        WHERE DATE(s.created_at) = CURDATE()
+        SELECT COALESCE(SUM((unit_price - unit_cost) * quantity), 0) as profit
+        FROM sale_items
+        WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY
     """)
     today_profit = float(cursor.fetchone()['profit'])
     
     # 5. Top 3 Products Today
-    cursor.execute("""
-        SELECT p.name, SUM(si.quantity) as total_sold
-        FROM sale_items si
-        JOIN products p ON si.product_id = p.id
-        JOIN sales s ON si.sale_id = s.id
-        WHERE DATE(s.created_at) = CURDATE()
-        GROUP BY p.id ORDER BY total_sold DESC LIMIT 3
-    """)
-    top_products = cursor.fetchall()
+    top_products, _ = top_selling(cursor, 'today', 3)
     
     # 6. Live Alerts (From Products table)
     cursor.execute("""
@@ -136,22 +254,16 @@ def dashboard():
                            alerts=alerts)
 
 # ---------- PRODUCT ROUTES ----------
-@app.route('/products')
+@bp.route('/products')
 def products():
     if not session.get('loggedin'):
         flash('Please login first', 'error')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     
-    # Get ALL products from database
-    cursor.execute("""
-        SELECT p.*, c.name as category_name 
-        FROM products p 
-        LEFT JOIN categories c ON p.category_id = c.id 
-        ORDER BY p.id DESC
-    """)
-    products_list = cursor.fetchall()
+    # Get ALL products from the shared catalog snapshot
+    products_list = get_catalog(cursor).rows(order='id_desc')
     
     # Get categories from database
     categories = get_categories()
@@ -161,11 +273,11 @@ def products():
                          products=products_list,
                          categories=categories)
 
-@app.route('/add_product', methods=['POST'])
+@bp.route('/add_product', methods=['POST'])
 def add_product():
     if not session.get('loggedin'):
         flash('Please login first', 'error')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     try:
         # Get form data
@@ -178,7 +290,7 @@ def add_product():
         
         # Save to MySQL database
         description = request.form.get('description', '')
-        cursor = mysql.connection.cursor()
+        cursor = db.cursor()
 
         cursor.execute("""
             INSERT INTO products (name, category_id, purchase_price, selling_price, 
@@ -196,18 +308,19 @@ def add_product():
                 VALUES (%s, %s)
             """, (product_id, f'Low stock: {stock_quantity} units (min: {min_stock_level})'))
         
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor)
         
         flash(f'✅ Product "{name}" added successfully!', 'success')
         
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         flash(f'❌ Error: {str(e)}', 'error')
     
-    return redirect(url_for('products'))
+    return redirect(url_for('main.products'))
 
 # ---------- STOCK UPDATE ROUTE ----------
-@app.route('/update_stock/<int:product_id>', methods=['POST'])
+@bp.route('/update_stock/<int:product_id>', methods=['POST'])
 def update_stock(product_id):
     if not session.get('loggedin'):
         return jsonify({'error': 'Please login first'}), 401
@@ -217,7 +330,7 @@ def update_stock(product_id):
         reason = request.form.get('reason', 'Manual Update') # Captured from new JS
         
         # Use DictCursor for easier data handling
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = db.cursor()
         
         # Get current product info
         cursor.execute("SELECT name, min_stock_level FROM products WHERE id = %s", (product_id,))
@@ -247,7 +360,8 @@ def update_stock(product_id):
             # Mark alert as resolved if stock is now sufficient
             cursor.execute("UPDATE alerts SET is_resolved = TRUE WHERE product_id = %s", (product_id,))
         
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor, [product_id])
         return jsonify({
             'success': True,
             'message': f'Stock updated to {new_stock}',
@@ -255,11 +369,11 @@ def update_stock(product_id):
         })
     
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         return jsonify({'error': str(e)}), 400
 
 # ---------- EDIT PRODUCT ROUTE ----------
-@app.route('/edit_product/<int:product_id>', methods=['POST'])
+@bp.route('/edit_product/<int:product_id>', methods=['POST'])
 def edit_product(product_id):
     if not session.get('loggedin'):
         return jsonify({'error': 'Please login first'}), 401
@@ -272,7 +386,7 @@ def edit_product(product_id):
         min_stock_level = int(request.form.get('min_stock_level', 5))
         description = request.form.get('description', '')
         
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = db.cursor()
         
         # Get current stock to re-evaluate alert status
         cursor.execute("SELECT stock_quantity FROM products WHERE id = %s", (product_id,))
@@ -305,22 +419,23 @@ def edit_product(product_id):
         else:
             cursor.execute("UPDATE alerts SET is_resolved = TRUE WHERE product_id = %s", (product_id,))
         
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor)
         return jsonify({'success': True, 'message': 'Product updated successfully'})
     
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         return jsonify({'error': str(e)}), 400
 
 # ---------- DELETE PRODUCT ROUTE ----------
-@app.route('/delete_product/<int:product_id>', methods=['DELETE'])
+@bp.route('/delete_product/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
     # Security check
     if not session.get('loggedin') or session.get('role') != 'admin':
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = db.cursor()
         
         # Get product name
         cursor.execute("SELECT name FROM products WHERE id = %s", (product_id,))
@@ -345,41 +460,70 @@ def delete_product(product_id):
         cursor.execute("DELETE FROM alerts WHERE product_id = %s", (product_id,))
         cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
         
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor)
         return jsonify({'success': True, 'message': f'Product "{product_name}" deleted successfully'})
     
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         return jsonify({'error': str(e)}), 400
 
-        
+# ---------- STOCKTAKE ROUTE ----------
+@bp.route('/api/stocktake', methods=['POST'])
+def stocktake():
+    """Apply a count sheet: {"counts": [{"id", "counted", "reason"?}], "mode": "partial"|"full",
+    "reason": "...", "dry_run": false} -> variance report"""
+    if not session.get('loggedin'):
+        return jsonify({'error': 'Please login first'}), 401
+
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', 'partial')
+    if mode not in MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(MODES)}"}), 400
+    # A full count zeroes everything not on the sheet
+    if mode == 'full' and session.get('role') != 'admin':
+        return jsonify({'error': 'Admin access required for a full stocktake'}), 403
+
+    try:
+        sheet = parse_sheet(data.get('counts'), current_app.config['STOCKTAKE_MAX_LINES'])
+    except StocktakeError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cursor = db.cursor()
+    try:
+        report = run_stocktake(cursor, sheet, mode, data.get('reason') or 'Stocktake', session.get('id'))
+        if data.get('dry_run'):
+            db.rollback()
+            return jsonify({'success': True, 'dry_run': True, **report})
+
+        db.commit()
+        # Large counts touch most of the catalog; a rebuild is one query either way
+        adjusted = [line['id'] for line in report['variances']]
+        if adjusted:
+            catalog_changed(cursor, adjusted if len(adjusted) <= 1000 else None)
+        return jsonify({'success': True, 'dry_run': False, **report})
+
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 400
+
+
 # ---------- SALES/POS ROUTES ----------
 # ---------- UPDATED POS ROUTE ----------
-@app.route('/pos')
+@bp.route('/pos')
 def pos():
     if 'loggedin' not in session:
         flash('Please login first', 'error')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     
-    # Get products with categories
-    cursor.execute("""
-        SELECT p.*, c.name as category_name 
-        FROM products p 
-        LEFT JOIN categories c ON p.category_id = c.id 
-        WHERE p.stock_quantity > 0 
-        ORDER BY p.name
-    """)
-    products = cursor.fetchall()
-
-    # 🔥 FIX: Convert Decimal prices to float for JavaScript compatibility
-    for p in products:
-        p['selling_price'] = float(p['selling_price'])
-        p['purchase_price'] = float(p['purchase_price'])
+    # In-stock products with categories, from the shared catalog snapshot
+    # (prices are already floats there, so they serialize straight to JavaScript)
+    products = get_catalog(cursor).rows(order='name', in_stock=True)
     
     # Get next invoice number
-    cursor.execute("SELECT COUNT(*) as count FROM sales WHERE DATE(created_at) = CURDATE()")
+    cursor.execute("SELECT COUNT(*) as count FROM sales WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY")
     today_count = cursor.fetchone()['count']
     next_invoice = f"INV{datetime.now().strftime('%Y%m%d')}{today_count + 1:03d}"
     
@@ -390,42 +534,15 @@ def pos():
 
 
 # ---------- UPDATED SEARCH API ----------
-@app.route('/api/products/search')
+@bp.route('/api/products/search')
 def search_products():
     if 'loggedin' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
-    query = request.args.get('q', '')
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    if query:
-        cursor.execute("""
-            SELECT p.*, c.name as category_name 
-            FROM products p 
-            LEFT JOIN categories c ON p.category_id = c.id 
-            WHERE (p.name LIKE %s OR p.id = %s) 
-            AND p.stock_quantity > 0
-            LIMIT 10
-        """, (f'%{query}%', query if query.isdigit() else 0))
-    else:
-        cursor.execute("""
-            SELECT p.*, c.name as category_name 
-            FROM products p 
-            LEFT JOIN categories c ON p.category_id = c.id 
-            WHERE p.stock_quantity > 0 
-            LIMIT 20
-        """)
-    
-    products = cursor.fetchall()
-
-    # CRITICAL FIX: Convert Decimal to float for JSON
-    for p in products:
-        p['selling_price'] = float(p['selling_price'])
-        p['purchase_price'] = float(p['purchase_price'])
-
-    return jsonify(products)
+    cursor = db.cursor()
+    return jsonify(queries.search_products(get_catalog(cursor), request.args.get('q', '')))
 
-@app.route('/create_sale', methods=['POST'])
+@bp.route('/create_sale', methods=['POST'])
 def create_sale():
     if 'loggedin' not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
@@ -439,45 +556,66 @@ def create_sale():
     import random
     invoice_no = f"INV-{random.randint(100000, 999999)}"
 
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     try:
-        # 1. Insert into Sales table
-        query_sale = "INSERT INTO sales (invoice_no, total_amount, payment_mode) VALUES (%s, %s, %s)"
-        cursor.execute(query_sale, (invoice_no, total_amount, payment_mode))
+        # 1. Insert into Sales table (same timestamp goes on every item so
+        #    both tables land in the same monthly partition). Database clock,
+        #    so it agrees with the CURDATE()/NOW() filters in the reports
+        sold_at = db_now(cursor)
+        query_sale = "INSERT INTO sales (invoice_no, total_amount, payment_mode, created_at) VALUES (%s, %s, %s, %s)"
+        cursor.execute(query_sale, (invoice_no, total_amount, payment_mode, sold_at))
         sale_id = cursor.lastrowid
 
         # 2. Process each item
+        event_items = []
         for item in items:
-            # Insert into sale_items
+            # Insert into sale_items, snapshotting today's cost so profit
+            # reports don't change when the product is edited later
             query_item = """
-                INSERT INTO sale_items (sale_id, product_id, quantity, unit_price, subtotal) 
-                VALUES (%s, %s, %s, %s, %s)
+                INSERT INTO sale_items (sale_id, product_id, quantity, unit_price, unit_cost, subtotal, created_at)
+                SELECT %s, id, %s, %s, purchase_price, %s, %s FROM products WHERE id = %s
             """
             subtotal = item['quantity'] * item['price']
-            cursor.execute(query_item, (sale_id, item['id'], item['quantity'], item['price'], subtotal))
+            cursor.execute(query_item, (sale_id, item['quantity'], item['price'], subtotal, sold_at, item['id']))
+            if cursor.rowcount == 0:
+                raise Exception(f"Product {item['id']} not found")
+            item_id = cursor.lastrowid
 
             # 3. Deduct stock
             query_stock = "UPDATE products SET stock_quantity = stock_quantity - %s WHERE id = %s"
             cursor.execute(query_stock, (item['quantity'], item['id']))
 
-            # 4. 🔥 SMART FEATURE: Check for Low Stock after deduction
-            # Fetch updated stock and min_level
-            cursor.execute("SELECT name, stock_quantity, min_stock_level FROM products WHERE id = %s", (item['id'],))
-            prod = cursor.fetchone()
+            event_items.append({'id': item_id, 'product_id': item['id'],
+                                'quantity': item['quantity'], 'unit_price': item['price']})
+
+        # 4. 🔥 SMART FEATURE: low-stock alerts, rollups and notifications
+        #    run from the outbox once this transaction commits
+        publish(cursor, 'sale_created', {
+            'sale_id': sale_id,
+            'invoice_no': invoice_no,
+            'created_at': sold_at,
+            'total': total_amount,
+            'payment_mode': payment_mode,
+            'items': event_items,
+        })
+
+        db.commit()
 
-            if prod and prod['stock_quantity'] <= prod['min_stock_level']:
-                # Check if an active alert already exists so we don't spam the database
-                cursor.execute("SELECT id FROM alerts WHERE product_id = %s AND is_resolved = FALSE", (item['id'],))
-                existing_alert = cursor.fetchone()
+        # Count this sale in the top-seller sketch right away (in memory)
+        for line in event_items:
+            current_app.extensions['topk'].record(line['id'], line['product_id'], line['quantity'], sold_at)
 
-                alert_msg = f"Low stock: {prod['stock_quantity']} units remaining (Min: {prod['min_stock_level']})"
-                
-                if existing_alert:
-                    cursor.execute("UPDATE alerts SET message = %s WHERE id = %s", (alert_msg, existing_alert['id']))
-                else:
-                    cursor.execute("INSERT INTO alerts (product_id, message) VALUES (%s, %s)", (item['id'], alert_msg))
+        # After the till has its answer: patch the catalog and warm this
+        # worker's receipt cache so the auto-opened receipt needs no queries
+        # (not in the outbox: the dispatcher's cache is its own)
+        product_ids = [line['product_id'] for line in event_items]
+
+        def after_sale(cursor):
+            catalog_changed(cursor, product_ids)
+            render_receipts(cursor, get_receipt_cache(), [sale_id])
+
+        after_response(after_sale)
 
-        mysql.connection.commit()
         return jsonify({
             "success": True, 
             "invoice": invoice_no, 
@@ -485,26 +623,26 @@ def create_sale():
         })
     
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         print(f"Error: {str(e)}") 
         return jsonify({"success": False, "error": str(e)})
         
 # ---------- REPORTS ROUTES ----------
 # ---------- REPORTS ROUTES ----------
-@app.route('/reports')
+@bp.route('/reports')
 def reports():
     if 'loggedin' not in session:
         flash('Please login first', 'error')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     
     # 1. Today's sales (Correct as is)
     cursor.execute("""
         SELECT COUNT(*) as transactions,
                COALESCE(SUM(total_amount), 0) as revenue
         FROM sales 
-        WHERE DATE(created_at) = CURDATE()
+        WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY
     """)
     today = cursor.fetchone()
     
@@ -523,18 +661,8 @@ def reports():
     """)
     low_stock = cursor.fetchall()
     
-    # 4. FIX: Top selling products (Added all selected columns to GROUP BY)
-    cursor.execute("""
-        SELECT p.name, p.selling_price, p.purchase_price, 
-               COALESCE(SUM(si.quantity), 0) as total_sold
-        FROM products p
-        LEFT JOIN sale_items si ON p.id = si.product_id
-        LEFT JOIN sales s ON si.sale_id = s.id 
-             AND s.created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-        GROUP BY p.id, p.name, p.selling_price, p.purchase_price
-        ORDER BY total_sold DESC LIMIT 5
-    """)
-    top_products = cursor.fetchall()
+    # 4. Top selling products over the last 30 days
+    top_products, _ = top_selling(cursor, '30d', 5)
 
     # 5. FIX: Chart Data (Group by the same formatted string we Select)
     cursor.execute("""
@@ -561,17 +689,15 @@ def reports():
     cat_values = [int(row['count']) for row in cat_results]
 
     # 7. Metrics (Correct as is)
-    cursor.execute("SELECT AVG(total_amount) as avg FROM sales WHERE DATE(created_at) = CURDATE()")
+    cursor.execute("SELECT AVG(total_amount) as avg FROM sales WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY")
     avg_sale = cursor.fetchone()['avg'] or 0
     
     cursor.execute("""
         SELECT 
-            COALESCE(SUM(si.unit_price * si.quantity), 0) as revenue,
-            COALESCE(SUM((si.unit_price - p.purchase_price) * si.quantity), 0) as profit
-        FROM sale_items si
-        JOIN products p ON si.product_id = p.id
-        JOIN sales s ON si.sale_id = s.id
-        WHERE DATE(s.created_at) = CURDATE()
+            COALESCE(SUM(unit_price * quantity), 0) as revenue,
+            COALESCE(SUM((unit_price - unit_cost) * quantity), 0) as profit
+        FROM sale_items
+        WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY
     """)
     profit_data = cursor.fetchone()
     
@@ -597,67 +723,117 @@ def reports():
                            cat_labels=cat_labels,
                            cat_values=cat_values)
 
-@app.route('/api/recent_sales')
+@bp.route('/api/recent_sales')
 def recent_sales():
     if 'loggedin' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("""
-        SELECT s.*, 
-               (SELECT COUNT(*) FROM sale_items WHERE sale_id = s.id) as item_count
-        FROM sales s
-        ORDER BY s.created_at DESC
-        LIMIT 10
-    """)
-    sales = cursor.fetchall()
+    cursor = db.cursor()
+    cursor.execute(*queries.recent_sales_query(current_app.config['RECENT_SALES_DAYS']))
+    return jsonify(queries.shape_sales(cursor.fetchall()))
+
+@bp.route('/api/admission/stats')
+def admission_stats():
+    if 'loggedin' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    return jsonify(current_app.extensions['admission'].snapshot())
+
+@bp.route('/api/top_products')
+def top_products_api():
+    """?window=hour|today|day|7d|30d&k=1..TOPK_MAX_K (at most TOPK_CAPACITY in sketch mode; default 10)
+    [&validate=1 to compare with the exact SQL answer]"""
+    if 'loggedin' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
     
-    for sale in sales:
-        # 1. Fix Decimal (for total_amount)
-        if 'total_amount' in sale and sale['total_amount'] is not None:
-            sale['total_amount'] = float(sale['total_amount'])
-        
-        # 2. FIX: Convert datetime to string (Critical for JSON)
-        if 'created_at' in sale and sale['created_at'] is not None:
-            # Format: '2023-10-27 14:30:00'
-            sale['created_at'] = sale['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+    window = request.args.get('window', 'today')
+    if window not in WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(WINDOWS)}"}), 400
+    k = request.args.get('k', '10')
+    max_k = current_app.config['TOPK_MAX_K']
+    if current_app.config['TOPK_MODE'] != 'sql':
+        max_k = min(max_k, current_app.config['TOPK_CAPACITY'])
+    if not k.isdigit() or not 1 <= int(k) <= max_k:
+        return jsonify({'error': f"k must be an integer between 1 and {max_k}"}), 400
+    k = int(k)
+    
+    cursor = db.cursor()
+    now = db_now(cursor)
+    rows, error_bound = top_selling(cursor, window, k, now)
+    result = {
+        'window': window,
+        'mode': current_app.config['TOPK_MODE'],
+        'error_bound': error_bound,
+        'products': [{'id': r['id'], 'name': r['name'], 'total_sold': int(r['total_sold']),
+                      'error': r.get('error', 0)} for r in rows],
+    }
     
-    return jsonify(sales)
+    if request.args.get('validate'):
+        cursor.execute(*queries.top_products_query(window_start(window, now), k))
+        exact = {r['id']: int(r['total_sold']) for r in cursor.fetchall()}
+        result['exact'] = [{'id': pid, 'total_sold': qty} for pid, qty in exact.items()]
+        result['max_abs_error'] = max((abs(p['total_sold'] - exact.get(p['id'], 0)) for p in result['products']), default=0)
+        # Ties may come back in any order: same ranking = same exact count at every position
+        ranked = dict(exact)
+        missing = [p['id'] for p in result['products'] if p['id'] not in ranked]
+        if missing:
+            cursor.execute(*queries.product_totals_query(window_start(window, now), missing))
+            ranked.update({r['id']: int(r['total_sold']) for r in cursor.fetchall()})
+        result['same_ranking'] = [ranked.get(p['id'], 0) for p in result['products']] == list(exact.values())
+    
+    return jsonify(result)
+
+@bp.route('/api/outbox/stats')
+def outbox_stats():
+    if 'loggedin' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    cursor = db.cursor()
+    return jsonify({**lag_metrics(cursor), 'dispatcher': current_app.extensions['outbox'].stats})
 
-@app.route('/receipt/<int:sale_id>')
+@bp.route('/receipt/<int:sale_id>')
 def view_receipt(sale_id):
     if 'loggedin' not in session:
-        return redirect(url_for('login'))
-    
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        return redirect(url_for('main.login'))
     
-    # Fetch the main sale info
-    cursor.execute("SELECT * FROM sales WHERE id = %s", (sale_id,))
-    sale = cursor.fetchone()
+    cursor = db.cursor()
+    receipt = render_receipts(cursor, get_receipt_cache(), [sale_id]).get(sale_id)
     
-    if not sale:
+    if not receipt:
         return "<h1>Error: Receipt Not Found</h1>", 404
+    
+    return render_template('receipt.html', invoice_no=receipt['invoice_no'], receipt_html=receipt['html'])
 
-    # Fetch the items - using LEFT JOIN so receipt works even if product is deleted
-    cursor.execute("""
-        SELECT si.*, COALESCE(p.name, 'Deleted Product') as product_name
-        FROM sale_items si
-        LEFT JOIN products p ON si.product_id = p.id
-        WHERE si.sale_id = %s
-    """, (sale_id,))
-    items = cursor.fetchall()
+@bp.route('/receipts/bulk')
+def bulk_receipts():
+    """Print many receipts at once: ?ids=1,2,3 or ?from=YYYY-MM-DD&to=YYYY-MM-DD"""
+    if 'loggedin' not in session:
+        return redirect(url_for('main.login'))
+    
+    limit = current_app.config['RECEIPT_BULK_LIMIT']
+    cursor = db.cursor()
     
-    return render_template('receipt.html', sale=sale, items=items)
+    try:
+        if request.args.get('ids'):
+            ids = [int(i) for i in request.args['ids'].split(',') if i.strip()][:limit]
+            found = render_receipts(cursor, get_receipt_cache(), ids)
+            receipts = [found[i] for i in ids if i in found]
+        else:
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+            end = datetime.strptime(request.args.get('to', request.args['from']), '%Y-%m-%d').date()
+            receipts = render_receipts_between(cursor, get_receipt_cache(), start, end, limit)
+    except (KeyError, ValueError):
+        return "<h1>Error: pass ?ids=1,2,3 or ?from=YYYY-MM-DD&to=YYYY-MM-DD</h1>", 400
+    
+    return render_template('receipts_bulk.html', receipts=receipts)
 
 
 # ========== CATEGORY MANAGEMENT ==========
-@app.route('/categories')
+@bp.route('/categories')
 def categories():
     if not session.get('loggedin'):
         flash('Please login first', 'error')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     cursor.execute("SELECT * FROM categories ORDER BY name")
     categories_list = cursor.fetchall()
     
@@ -665,36 +841,37 @@ def categories():
                          username=session['username'],
                          categories=categories_list)
 
-@app.route('/add_category', methods=['POST'])
+@bp.route('/add_category', methods=['POST'])
 def add_category():
     if not session.get('loggedin'):
         flash('Please login first', 'error')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     try:
         name = request.form.get('name')
         description = request.form.get('description', '')
         
-        cursor = mysql.connection.cursor()
+        cursor = db.cursor()
         cursor.execute("INSERT INTO categories (name, description) VALUES (%s, %s)",
                       (name, description))
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor)
         
         flash(f'✅ Category "{name}" added successfully!', 'success')
         
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         flash(f'❌ Error: {str(e)}', 'error')
     
-    return redirect(url_for('categories'))
+    return redirect(url_for('main.categories'))
 
 
-@app.route('/delete_category/<int:id>')
+@bp.route('/delete_category/<int:id>')
 def delete_category(id):
     if not session.get('loggedin'):
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     try:
         # 1. Check if an "Uncategorized" category exists, if not, create it
         cursor.execute("SELECT id FROM categories WHERE name = 'Uncategorized'")
@@ -709,7 +886,7 @@ def delete_category(id):
         # 2. Prevent deleting the "Uncategorized" category itself
         if id == uncat_id:
             flash("❌ Cannot delete the default Uncategorized category.", "error")
-            return redirect(url_for('categories'))
+            return redirect(url_for('main.categories'))
 
         # 3. Move all products in the category being deleted to "Uncategorized"
         cursor.execute("UPDATE products SET category_id = %s WHERE category_id = %s", (uncat_id, id))
@@ -717,23 +894,24 @@ def delete_category(id):
         # 4. Now safely delete the category
         cursor.execute("DELETE FROM categories WHERE id = %s", (id,))
         
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor)
         flash("✅ Category removed. Linked products moved to 'Uncategorized'.", "success")
         
     except Exception as e:
-        mysql.connection.rollback()
+        db.rollback()
         flash(f"❌ Error: {str(e)}", "error")
 
-    return redirect(url_for('categories'))
+    return redirect(url_for('main.categories'))
 
 # ========== DEMO RESET BUTTON ==========
-@app.route('/reset_demo')
+@bp.route('/reset_demo')
 def reset_demo():
     if 'loggedin' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     try:
-        cursor = mysql.connection.cursor()
+        cursor = db.cursor()
         
         # 1. Delete all sales
         cursor.execute("DELETE FROM sale_items")
@@ -744,53 +922,41 @@ def reset_demo():
         
         # 3. Clear all alerts
         cursor.execute("DELETE FROM alerts")
+
+        # 4. Pending post-checkout events and the rollup built from sale_items
+        cursor.execute("DELETE FROM outbox_deliveries")
+        cursor.execute("DELETE FROM outbox")
+        cursor.execute("DELETE FROM sales_daily_rollup")
         
-        mysql.connection.commit()
+        db.commit()
+        catalog_changed(cursor)
+        get_receipt_cache().clear()
+        current_app.extensions['topk'].reset()
         flash('✅ Demo reset! All sales cleared and stocks reset.', 'success')
         
     except Exception as e:
         flash(f'Error: {str(e)}', 'error')
     
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
 # ==========================================
 #        AI SMART FEATURES
 # ==========================================
 
-@app.route('/api/ai/recommendations/<int:product_id>')
+@bp.route('/api/ai/recommendations/<int:product_id>')
 def get_recommendations(product_id):
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # AI Query: Find other products that appear in the same 'sale_id' as the current product
-    query = """
-        SELECT p.id, p.name, p.selling_price, p.stock_quantity, COUNT(*) as frequency
-        FROM sale_items si1
-        JOIN sale_items si2 ON si1.sale_id = si2.sale_id
-        JOIN products p ON si2.product_id = p.id
-        WHERE si1.product_id = %s 
-        AND si2.product_id != %s
-        AND p.stock_quantity > 0
-        GROUP BY p.id
-        ORDER BY frequency DESC
-        LIMIT 1
-    """
-    cursor.execute(query, (product_id, product_id))
-    suggestion = cursor.fetchone()
-    
-    if suggestion:
-        suggestion['selling_price'] = float(suggestion['selling_price'])
-        return jsonify([suggestion])
-    return jsonify([])
-
-@app.route('/api/ai/optimize_stock')
+    cursor = db.cursor()
+    cursor.execute(*queries.recommendations_query(product_id, current_app.config['RECOMMENDATION_DAYS']))
+    return jsonify(queries.shape_recommendation(cursor.fetchone()))
+
+@bp.route('/api/ai/optimize_stock')
 def optimize_stock():
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = db.cursor()
     # Calculate average daily sales over the last 30 days
     cursor.execute("""
-        SELECT product_id, SUM(quantity)/30 as daily_velocity
-        FROM sale_items si
-        JOIN sales s ON si.sale_id = s.id
-        WHERE s.created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+        SELECT product_id, SUM(quantity)/30.0 as daily_velocity
+        FROM sale_items
+        WHERE created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
         GROUP BY product_id
     """)
     results = cursor.fetchall()
@@ -800,14 +966,15 @@ def optimize_stock():
         new_min = max(5, round((float(row['daily_velocity']) * 7) * 1.2))
         cursor.execute("UPDATE products SET min_stock_level = %s WHERE id = %s", (new_min, row['product_id']))
     
-    mysql.connection.commit()
+    db.commit()
+    catalog_changed(cursor)
     return jsonify({"success": True, "message": "Inventory levels optimized based on sales trends!"})
 
 
-@app.route('/api/ai/price_strategy/<int:product_id>')
+@bp.route('/api/ai/price_strategy/<int:product_id>')
 def price_strategy(product_id):
     try:
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = db.cursor()
         cursor.execute("""
             SELECT p.*, 
             (SELECT SUM(quantity) FROM sale_items WHERE product_id = p.id) as total_sold
@@ -825,7 +992,7 @@ def price_strategy(product_id):
         stock = int(product['stock_quantity'])
 
         # Groq works best with a system message and a user message
-        completion = client.chat.completions.create(
+        completion = get_ai_client().chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[
                 {
@@ -866,4 +1033,4 @@ if __name__ == '__main__':
     # Get port from Railway, default to 5001 for local testing
     port = int(os.getenv("PORT", 5001))
     # host='0.0.0.0' is required for cloud deployment
-    app.run(host='0.0.0.0', port=port, debug=False)
+    create_app().run(host='0.0.0.0', port=port, debug=False)
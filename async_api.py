@@ -0,0 +1,176 @@
+"""
+Asyncio tier for the small, I/O-bound read APIs.
+
+Serves /api/products/search, /api/recent_sales and /api/ai/recommendations/<id>
+from one event loop per process with an aiomysql pool, so a slow round trip to
+the remote MySQL no longer pins a whole sync worker. SQL and JSON shaping come
+from queries.py, the same code the Flask routes use.
+
+Not part of the default deploy (Procfile starts only the Flask app, which
+serves the same paths). To use it, run it on the SAME host as the Flask
+workers and have the reverse proxy in front of both send these three paths
+here. It must share the host because search reads the catalog snapshot file
+(CATALOG_PATH) that the Flask workers patch after every checkout. On another
+host or container it would only see its own copy, up to CATALOG_MAX_AGE old.
+
+    gunicorn async_api:create_async_app --worker-class aiohttp.GunicornWebWorker
+"""
+import asyncio
+import json
+import os
+import ssl
+from datetime import date, datetime
+from decimal import Decimal
+from functools import partial
+
+import aiomysql
+from aiohttp import web
+from dotenv import load_dotenv
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.http import http_date
+
+import queries
+from catalog import REBUILD_SQL, CatalogSnapshot, claim_rebuild, is_stale, release_rebuild, write_snapshot
+from config import Config
+
+
+# ---------- JSON ----------
+def _json_default(value):
+    # Same encoding Flask's jsonify uses, so both tiers return identical bodies
+    if isinstance(value, (datetime, date)):
+        return http_date(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, dumps=partial(json.dumps, default=_json_default))
+
+
+# ---------- SESSION ----------
+def _session_serializer(config):
+    """Reads the Flask session cookie so both tiers share one login"""
+    flask_app = Flask(__name__)
+    flask_app.secret_key = config.SECRET_KEY
+    return SecureCookieSessionInterface().get_signing_serializer(flask_app), flask_app.config['SESSION_COOKIE_NAME']
+
+def _logged_in(request):
+    serializer, cookie_name = request.app['session']
+    cookie = request.cookies.get(cookie_name)
+    if not cookie:
+        return False
+    try:
+        return bool(serializer.loads(cookie).get('loggedin'))
+    except Exception:
+        return False
+
+
+# ---------- POOL ----------
+async def get_pool(app):
+    """aiomysql pool, created on the first request that needs it"""
+    async with app['pool_lock']:
+        if app['pool'] is None:
+            config = app['config']
+            ssl_ctx = ssl.create_default_context(cafile=config.MYSQL_SSL_CA) if config.MYSQL_SSL_CA else None
+            app['pool'] = await aiomysql.create_pool(
+                host=config.MYSQL_HOST, port=config.MYSQL_PORT,
+                user=config.MYSQL_USER, password=config.MYSQL_PASSWORD, db=config.MYSQL_DB,
+                minsize=1, maxsize=config.ASYNC_POOL_SIZE, ssl=ssl_ctx,
+                autocommit=True, cursorclass=aiomysql.DictCursor,
+            )
+    return app['pool']
+
+async def fetch(app, sql, params, one=False):
+    pool = await get_pool(app)
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, params)
+            return await (cursor.fetchone() if one else cursor.fetchall())
+
+async def close_pool(app):
+    if app['pool'] is not None:
+        app['pool'].close()
+        await app['pool'].wait_closed()
+
+
+# ---------- CATALOG ----------
+async def get_catalog(app):
+    """Same snapshot and staleness rule as app.get_catalog"""
+    config, catalog = app['config'], app['catalog']
+    if is_stale(config.CATALOG_PATH, config.CATALOG_MAX_AGE):
+        # flock + file write: keep them off the event loop. Only the first
+        # process to claim the rebuild does it; the others wait and skip
+        loop = asyncio.get_running_loop()
+        claim = await loop.run_in_executor(None, claim_rebuild, config.CATALOG_PATH, config.CATALOG_MAX_AGE)
+        if claim is not None:
+            try:
+                rows = await fetch(app, REBUILD_SQL, None)
+                await loop.run_in_executor(None, write_snapshot, config.CATALOG_PATH, rows, claim[1])
+            finally:
+                release_rebuild(claim)
+        return catalog.refresh(force=True)
+    return catalog.refresh()
+
+
+# ---------- MIDDLEWARE ----------
+@web.middleware
+async def track_in_flight(request, handler):
+    """Count concurrent requests per process (exposed at /api/async/stats)"""
+    stats = request.app['stats']
+    stats['in_flight'] += 1
+    stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+    try:
+        return await handler(request)
+    finally:
+        stats['in_flight'] -= 1
+        stats['served'] += 1
+
+
+# ---------- HANDLERS ----------
+async def search_products(request):
+    if not _logged_in(request):
+        return json_response({'error': 'Not logged in'}, status=401)
+
+    catalog = await get_catalog(request.app)
+    return json_response(queries.search_products(catalog, request.query.get('q', '')))
+
+async def recent_sales(request):
+    if not _logged_in(request):
+        return json_response({'error': 'Not logged in'}, status=401)
+
+    rows = await fetch(request.app, *queries.recent_sales_query(request.app['config'].RECENT_SALES_DAYS))
+    return json_response(queries.shape_sales(rows))
+
+async def get_recommendations(request):
+    product_id = int(request.match_info['product_id'])
+    row = await fetch(request.app, *queries.recommendations_query(
+        product_id, request.app['config'].RECOMMENDATION_DAYS), one=True)
+    return json_response(queries.shape_recommendation(row))
+
+async def stats(request):
+    return json_response({'pid': os.getpid(), **request.app['stats']})
+
+
+# ---------- APP ----------
+async def create_async_app(config_object=Config):
+    load_dotenv()
+
+    app = web.Application(middlewares=[track_in_flight])
+    app['config'] = config_object
+    app['session'] = _session_serializer(config_object)
+    app['pool_lock'] = asyncio.Lock()
+    app['pool'] = None
+    app['catalog'] = CatalogSnapshot(config_object.CATALOG_PATH)
+    app['stats'] = {'in_flight': 0, 'peak_in_flight': 0, 'served': 0}
+
+    app.router.add_get('/api/products/search', search_products)
+    app.router.add_get('/api/recent_sales', recent_sales)
+    app.router.add_get(r'/api/ai/recommendations/{product_id:\d+}', get_recommendations)
+    app.router.add_get('/api/async/stats', stats)
+    app.on_cleanup.append(close_pool)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_async_app(), port=int(os.getenv('ASYNC_PORT', 5002)))
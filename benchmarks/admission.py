@@ -0,0 +1,85 @@
+"""
+Checkout latency while /reports is saturated (admission control load test).
+
+    python benchmarks/admission.py --url http://localhost:5001 --cookie "session=..." \
+        --product-id 1 [--checkout-clients 4] [--report-clients 32] [--seconds 15]
+
+Phase 1 measures create_sale alone; phase 2 repeats it while many clients
+hammer /reports. With admission control, checkout p99 should stay flat and
+the excess report requests come back as fast 503s. Each checkout inserts a
+real one-item sale, so point this at a demo database (/reset_demo afterwards),
+e.g. gunicorn with DB_BACKEND=sqlite and a seeded SQLITE_PATH.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[max(0, int(len(values) * q) - 1)] if values else 0
+
+
+async def _checkout_client(session, url, product_id, deadline, latencies, statuses):
+    payload = {'items': [{'id': product_id, 'quantity': 1, 'price': 1.0}], 'total': 1.0, 'payment_mode': 'cash'}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with session.post(url + '/create_sale', json=payload) as response:
+            await response.read()
+            statuses[response.status] += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def _report_client(session, url, deadline, statuses, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with session.get(url + '/reports') as response:
+            await response.read()
+            statuses[response.status] += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def phase(args, report_clients):
+    checkout_ms, report_ms = [], []
+    checkout_status, report_status = Counter(), Counter()
+    connector = aiohttp.TCPConnector(limit=args.checkout_clients + report_clients)
+    async with aiohttp.ClientSession(connector=connector, headers={'Cookie': args.cookie}) as session:
+        deadline = time.perf_counter() + args.seconds
+        tasks = [_checkout_client(session, args.url, args.product_id, deadline, checkout_ms, checkout_status)
+                 for _ in range(args.checkout_clients)]
+        tasks += [_report_client(session, args.url, deadline, report_status, report_ms)
+                  for _ in range(report_clients)]
+        await asyncio.gather(*tasks)
+    return checkout_ms, checkout_status, report_ms, report_status
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--cookie', required=True)
+    parser.add_argument('--product-id', type=int, required=True)
+    parser.add_argument('--checkout-clients', type=int, default=4)
+    parser.add_argument('--report-clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=15)
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+
+    for label, report_clients in (('checkout only', 0), ('reports saturated', args.report_clients)):
+        checkout_ms, checkout_status, report_ms, report_status = await phase(args, report_clients)
+        print(f"== {label}")
+        print(f"   checkout: n={len(checkout_ms)} p50={_pct(checkout_ms, 0.5):.1f}ms "
+              f"p99={_pct(checkout_ms, 0.99):.1f}ms status={dict(checkout_status)}")
+        if report_clients:
+            print(f"   reports:  n={len(report_ms)} p50={_pct(report_ms, 0.5):.1f}ms "
+                  f"status={dict(report_status)} (503 = shed)")
+
+    async with aiohttp.ClientSession(headers={'Cookie': args.cookie}) as session:
+        async with session.get(args.url + '/api/admission/stats') as response:
+            print(f"== admission stats (one worker): {await response.text()}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+Catalog snapshot benchmark: memory per worker and hydration time.
+
+    python benchmarks/catalog.py [--skus 100000] [--workers 4]
+
+Builds a synthetic catalog, then compares the old per-worker shape (a list of
+DictCursor-style dicts with Decimal prices, converted to float in a loop) with
+the mmap()ed snapshot from catalog.py. Memory is read from
+/proc/self/smaps_rollup in forked "workers", so shared page-cache pages are
+reported separately from each worker's private memory. Needs no database.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CatalogSnapshot, apply_stock, write_snapshot  # noqa: E402
+
+CATEGORIES = ['Grocery', 'Beverages', 'Snacks', 'Dairy', 'Household', 'Personal Care', 'Stationery']
+
+
+def synthetic_products(n):
+    random.seed(42)
+    for i in range(1, n + 1):
+        cost = Decimal(random.randint(500, 50000)) / 100
+        yield {
+            'id': i,
+            'name': f"{random.choice(CATEGORIES)} item {i:06d}",
+            'category_id': i % len(CATEGORIES) + 1,
+            'category_name': CATEGORIES[i % len(CATEGORIES)],
+            'description': random.choice(['', 'Imported', 'Local', 'Best seller']),
+            'purchase_price': cost,
+            'selling_price': (cost * Decimal('1.25')).quantize(Decimal('0.01')),
+            'stock_quantity': random.randint(0, 200),
+            'min_stock_level': 5,
+        }
+
+
+def memory_kb():
+    """(anonymous, file-backed) resident kB for this process
+
+    Anonymous memory is private to each worker; file-backed pages of the
+    snapshot live in the page cache and are shared by every worker mapping it.
+    """
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Anonymous'], fields['Rss'] - fields['Anonymous']
+
+
+def in_worker(fn):
+    """Run fn in a forked child and return what it printed on a pipe"""
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        os.write(w, repr(fn()).encode())
+        os._exit(0)
+    os.close(w)
+    data = b''
+    while chunk := os.read(r, 65536):
+        data += chunk
+    os.waitpid(pid, 0)
+    return eval(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--skus', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'catalog.bin')
+    rows = list(synthetic_products(args.skus))
+
+    start = time.perf_counter()
+    write_snapshot(path, rows)
+    print(f"SKUs: {args.skus:,}   snapshot file: {os.path.getsize(path) / 1024 / 1024:.1f} MB   "
+          f"build: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # --- old shape: list of dicts with Decimal, converted per request
+    def dict_worker():
+        gc.collect()
+        before = memory_kb()[0]
+        tracemalloc.start()
+        fetched = list(synthetic_products(args.skus))  # what cursor.fetchall() hands back
+        t0 = time.perf_counter()
+        products = [dict(p) for p in fetched]
+        for p in products:
+            p['selling_price'] = float(p['selling_price'])
+            p['purchase_price'] = float(p['purchase_price'])
+        elapsed = time.perf_counter() - t0
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return {'ms': elapsed * 1000, 'heap_mb': heap / 1024 / 1024,
+                'private_mb': (memory_kb()[0] - before) / 1024}
+
+    # --- snapshot: map, scan a column, search, and fully hydrate
+    def snapshot_worker():
+        gc.collect()
+        before_anon, before_file = memory_kb()
+        t0 = time.perf_counter()
+        snap = CatalogSnapshot(path).refresh()
+        mapped = time.perf_counter()
+        in_stock = sum(1 for s in snap.cols['stock_quantity'] if s > 0)
+        scanned = time.perf_counter()
+        hits = snap.search('snacks item 0999', 10)
+        searched = time.perf_counter()
+        anon, file_backed = memory_kb()
+        snap.rows(order='name', in_stock=True)
+        hydrated = time.perf_counter()
+        return {
+            'map_ms': (mapped - t0) * 1000,
+            'scan_ms': (scanned - mapped) * 1000,
+            'search_ms': (searched - scanned) * 1000,
+            'hydrate_ms': (hydrated - searched) * 1000,
+            'private_mb': (anon - before_anon) / 1024,
+            'shared_mb': (file_backed - before_file) / 1024,
+            'in_stock': in_stock, 'hits': len(hits),
+        }
+
+    old = [in_worker(dict_worker) for _ in range(args.workers)]
+    new = [in_worker(snapshot_worker) for _ in range(args.workers)]
+
+    print("\nPer worker, old (DictCursor rows + Decimal->float loop):")
+    print(f"  copy + convert {sum(o['ms'] for o in old) / len(old):.0f} ms   "
+          f"python heap {old[0]['heap_mb']:.1f} MB   private RSS +{sum(o['private_mb'] for o in old) / len(old):.1f} MB")
+    print("Per worker, snapshot (mmap):")
+    n = new[0]
+    print(f"  map {n['map_ms']:.2f} ms   column scan {n['scan_ms']:.1f} ms   "
+          f"search {n['search_ms']:.1f} ms   full hydration {n['hydrate_ms']:.0f} ms")
+    print(f"  private RSS +{sum(x['private_mb'] for x in new) / len(new):.1f} MB   "
+          f"shared (page cache, once per host) +{n['shared_mb']:.1f} MB   in stock {n['in_stock']:,}")
+
+    class StockCursor:
+        """Answers apply_stock's SELECT without a database"""
+        def execute(self, sql, params):
+            self.rows = [{'id': i, 'stock_quantity': 7} for i in params]
+
+        def fetchall(self):
+            return self.rows
+
+    start = time.perf_counter()
+    apply_stock(path, StockCursor(), list(range(1, 1001)))
+    print(f"\nIn-place stock delta for 1,000 SKUs: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
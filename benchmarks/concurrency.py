@@ -0,0 +1,79 @@
+"""
+Load test for the hot read APIs: sync Flask workers vs the asyncio tier.
+
+    python benchmarks/concurrency.py --sync http://localhost:5001 \
+        --async http://localhost:5002 --cookie "session=..." [--levels 1,8,32,128]
+
+Fires `level` concurrent clients at each endpoint for --seconds and reports
+throughput and latency percentiles. For the async tier it also reads
+/api/async/stats to show the peak number of requests in flight in one process.
+Copy the session cookie from a logged-in browser; both tiers accept it.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+ENDPOINTS = ['/api/products/search?q=a', '/api/recent_sales', '/api/ai/recommendations/1']
+
+
+async def _client(session, url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+        except aiohttp.ClientError as e:
+            errors.append(str(e))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run_level(base, path, level, seconds, cookie):
+    latencies, errors = [], []
+    connector = aiohttp.TCPConnector(limit=level)
+    async with aiohttp.ClientSession(connector=connector, headers={'Cookie': cookie}) as session:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*[_client(session, base + path, deadline, latencies, errors) for _ in range(level)])
+    latencies.sort()
+    return {
+        'rps': len(latencies) / seconds,
+        'p50': statistics.median(latencies) if latencies else 0,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] if latencies else 0,
+        'errors': len(errors),
+    }
+
+
+async def peak_in_flight(base, cookie):
+    async with aiohttp.ClientSession(headers={'Cookie': cookie}) as session:
+        async with session.get(base + '/api/async/stats') as response:
+            return (await response.json()).get('peak_in_flight')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sync', dest='sync_url', help='Base URL of the Flask/gunicorn app')
+    parser.add_argument('--async', dest='async_url', help='Base URL of async_api.py')
+    parser.add_argument('--cookie', default='', help='Cookie header of a logged-in session')
+    parser.add_argument('--levels', default='1,8,32,128')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.levels.split(',')]
+    print(f"{'tier':<6} {'endpoint':<30} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for tier, base in (('sync', args.sync_url), ('async', args.async_url)):
+        if not base:
+            continue
+        for path in ENDPOINTS:
+            for level in levels:
+                r = await run_level(base.rstrip('/'), path, level, args.seconds, args.cookie)
+                print(f"{tier:<6} {path:<30} {level:>5} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p99']:>9.1f} {r['errors']:>7}")
+        if tier == 'async':
+            print(f"async peak requests in flight (one process): {await peak_in_flight(base.rstrip('/'), args.cookie)}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""
+Startup benchmark: import time, create_app() time and time to first request.
+
+    python benchmarks/startup.py [--runs 5]
+
+Each run uses a fresh interpreter so module caches don't hide import cost.
+The first request hits the login page, which needs no database.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+response = flask_app.test_client().get('/')
+t3 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'create_app_ms': (t2 - t1) * 1000,
+    'first_request_ms': (t3 - t2) * 1000,
+    'status': response.status_code,
+    'groq_imported': 'groq' in sys.modules,
+}))
+"""
+
+
+def run_once():
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+                         capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        values = [r[key] for r in results]
+        print(f"{key:<18} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}")
+    print(f"{'time_to_first_req':<18} median {statistics.median(r['import_ms'] + r['create_app_ms'] + r['first_request_ms'] for r in results):8.1f}")
+    print(f"groq imported at startup: {results[-1]['groq_imported']}   status: {results[-1]['status']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Bulk stocktake vs one update_stock request per SKU.
+
+    python benchmarks/stocktake.py [--skus 10000] [--per-sku 500]
+
+Seeds a fresh SQLite database (DB_BACKEND=sqlite) with --skus products, then
+posts one count sheet covering all of them to /api/stocktake (about a third
+of the lines differ, some drop below min stock) and times it. For
+comparison, --per-sku products are adjusted through /update_stock one
+request at a time and the total is extrapolated to the full sheet. Checks
+that stock, alerts and the variance report agree with the sheet.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from storage import db  # noqa: E402
+
+
+def seed(app, skus):
+    with app.app_context():
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO users (username, password, role) VALUES ('bench', 'bench', 'admin')")
+        cursor.execute("INSERT INTO categories (name, description) VALUES ('Grocery', '')")
+        random.seed(42)
+        for start in range(0, skus, 500):
+            rows = []
+            for i in range(start, min(start + 500, skus)):
+                cost = round(random.uniform(5, 500), 2)
+                rows.append((f'Product {i:05d}', 1, cost, round(cost * 1.25, 2), 50, 10, ''))
+            cursor.execute("""
+                INSERT INTO products (name, category_id, purchase_price, selling_price,
+                                      stock_quantity, min_stock_level, description)
+                VALUES """ + ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows)),
+                tuple(v for row in rows for v in row))
+        db.commit()
+        cursor.execute("SELECT id FROM products ORDER BY id")
+        return [row['id'] for row in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--skus', type=int, default=10000)
+    parser.add_argument('--per-sku', type=int, default=500, help='update_stock requests to time for comparison.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='smart-stock-stocktake-')
+
+    class BenchConfig(Config):
+        DB_BACKEND = 'sqlite'
+        SQLITE_PATH = os.path.join(workdir, 'smart_stock.db')
+        CATALOG_PATH = os.path.join(workdir, 'catalog.bin')
+        OUTBOX_INLINE = False
+
+    app = create_app(BenchConfig)
+    ids = seed(app, args.skus)
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    client.get('/pos')  # build the catalog snapshot
+
+    # ---------- ONE REQUEST PER SKU ----------
+    start = time.perf_counter()
+    for product_id in ids[:args.per_sku]:
+        client.post(f'/update_stock/{product_id}', data={'stock': 50, 'reason': 'Count'})
+    per_sku_s = (time.perf_counter() - start) / args.per_sku * len(ids)
+
+    # ---------- ONE SHEET ----------
+    random.seed(7)
+    counts = []
+    for product_id in ids:
+        counted = 50 if random.random() < 0.66 else random.randint(0, 80)
+        counts.append({'id': product_id, 'counted': counted, 'reason': 'Damaged' if counted < 50 else None})
+    expected_changes = {c['id']: c['counted'] for c in counts if c['counted'] != 50}
+
+    start = time.perf_counter()
+    response = client.post('/api/stocktake', json={'counts': counts, 'mode': 'partial', 'reason': 'Benchmark'})
+    bulk_s = time.perf_counter() - start
+    report = response.get_json()
+    if response.status_code != 200:
+        raise SystemExit(f"stocktake failed: {report}")
+
+    problems = []
+    if report['lines_counted'] != len(ids) or report['lines_adjusted'] != len(expected_changes):
+        problems.append(f"report counts {report['lines_counted']}/{report['lines_adjusted']}")
+    with app.app_context():
+        cursor = db.cursor()
+        cursor.execute("SELECT id, stock_quantity, min_stock_level FROM products")
+        products = cursor.fetchall()
+        cursor.execute("SELECT product_id FROM alerts WHERE is_resolved = FALSE")
+        alerted = {row['product_id'] for row in cursor.fetchall()}
+    for p in products:
+        if p['stock_quantity'] != expected_changes.get(p['id'], 50):
+            problems.append(f"stock mismatch for product {p['id']}")
+        if (p['stock_quantity'] <= p['min_stock_level']) != (p['id'] in alerted):
+            problems.append(f"alert mismatch for product {p['id']}")
+    catalog = client.get('/api/products/search?q=Product 00').get_json()
+    if any(row['stock_quantity'] != expected_changes.get(row['id'], 50) for row in catalog):
+        problems.append("catalog snapshot not updated")
+
+    print(f"skus={len(ids)} adjusted={report['lines_adjusted']} "
+          f"units_over={report['units_over']} units_short={report['units_short']} "
+          f"value_at_cost={report['value_at_cost']}")
+    print(f"/api/stocktake (one request):     {bulk_s:8.2f} s")
+    print(f"/update_stock x {len(ids)} (extrapolated): {per_sku_s:8.2f} s")
+    if problems:
+        raise SystemExit('\n'.join(['INCONSISTENT:'] + problems[:20]))
+    print('consistency checks passed')
+
+
+if __name__ == '__main__':
+    main()
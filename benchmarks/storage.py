@@ -0,0 +1,171 @@
+"""
+Same workload against either storage backend (see storage.py).
+
+    python benchmarks/storage.py --backend sqlite [--sales 500] [--products 200]
+    python benchmarks/storage.py --backend mysql --username admin --password ... [--sales 100]
+
+Drives the real Flask app through its test client: checkout (create_sale),
+then the dashboard, reports, POS, search, recent sales, receipts and top-k
+APIs, then drains the outbox. Reports p50 / p95 per route and checks that
+both backends agree on the results (stock deducted, outbox delivered, daily
+rollup equals the sale lines, sketch ranking equals the SQL ranking).
+
+SQLite runs on a fresh temporary database seeded with --products items.
+MySQL uses the configured database as is and inserts real sales, so point it
+at a demo database (/reset_demo afterwards).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from storage import db  # noqa: E402
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[max(0, int(len(values) * q) - 1)] if values else 0
+
+
+def seed(app, products):
+    with app.app_context():
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO users (username, password, role) VALUES ('bench', 'bench', 'admin')")
+        for name in ['Grocery', 'Beverages', 'Snacks', 'Dairy', 'Household']:
+            cursor.execute("INSERT INTO categories (name, description) VALUES (%s, %s)", (name, ''))
+        random.seed(42)
+        for i in range(products):
+            cost = round(random.uniform(5, 500), 2)
+            cursor.execute("""
+                INSERT INTO products (name, category_id, purchase_price, selling_price,
+                                      stock_quantity, min_stock_level, description)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (f'Product {i:05d}', random.randint(1, 5), cost, round(cost * 1.25, 2), 10000, 5, ''))
+        db.commit()
+
+
+def timed(timings, name, client, method, url, **kwargs):
+    start = time.perf_counter()
+    response = client.open(url, method=method, **kwargs)
+    timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+    if response.status_code >= 400:
+        raise SystemExit(f"{method} {url} -> {response.status_code}: {response.get_data(as_text=True)[:300]}")
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--sales', type=int, default=500)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--reads', type=int, default=50, help='Requests per read route.')
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='smart-stock-bench-')
+
+    class BenchConfig(Config):
+        DB_BACKEND = args.backend
+        SQLITE_PATH = os.path.join(workdir, 'smart_stock.db')
+        CATALOG_PATH = os.path.join(workdir, 'catalog.bin')
+        OUTBOX_INLINE = False
+        RECEIPT_CACHE_DIR = None
+        TOPK_REFRESH_SECONDS = 0
+
+    app = create_app(BenchConfig)
+    if args.backend == 'sqlite':
+        seed(app, args.products)
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': args.username, 'password': args.password})
+    if response.status_code != 302 or '/dashboard' not in response.headers.get('Location', ''):
+        raise SystemExit('Login failed; pass --username/--password for an existing user')
+
+    with app.app_context():
+        cursor = db.cursor()
+        cursor.execute("SELECT id, selling_price, stock_quantity FROM products WHERE stock_quantity > 100 LIMIT 200")
+        products = cursor.fetchall()
+    if not products:
+        raise SystemExit('No products with stock > 100 to sell')
+    stock_before = {p['id']: int(p['stock_quantity']) for p in products}
+
+    timings, sold = {}, {}
+    random.seed(7)
+    # Skewed basket so there is a clear top-k
+    weights = [1 / (rank + 1) for rank in range(len(products))]
+    for _ in range(args.sales):
+        basket = {}
+        for p in random.choices(products, weights, k=random.randint(1, 4)):
+            basket[p['id']] = (p, basket.get(p['id'], (p, 0))[1] + 1)
+        items = [{'id': pid, 'quantity': qty, 'price': float(p['selling_price'])} for pid, (p, qty) in basket.items()]
+        total = sum(i['quantity'] * i['price'] for i in items)
+        response = timed(timings, 'create_sale', client, 'POST', '/create_sale',
+                         json={'items': items, 'total': total, 'payment_mode': 'cash'})
+        if not response.get_json()['success']:
+            raise SystemExit(f"create_sale failed: {response.get_json()['error']}")
+        for item in items:
+            sold[item['id']] = sold.get(item['id'], 0) + item['quantity']
+    sale_id = response.get_json()['sale_id']
+
+    with app.app_context():
+        start = time.perf_counter()
+        dispatcher = app.extensions['outbox']
+        while dispatcher.run_once():
+            pass
+        timings['outbox drain'] = [(time.perf_counter() - start) * 1000]
+
+    today = time.strftime('%Y-%m-%d')
+    reads = [
+        ('dashboard', '/dashboard'), ('reports', '/reports'), ('pos', '/pos'),
+        ('search', '/api/products/search?q=duct 0'), ('recent_sales', '/api/recent_sales'),
+        ('receipt', f'/receipt/{sale_id}'), ('bulk_receipts', f'/receipts/bulk?from={today}'),
+        ('top_products', '/api/top_products?window=today&k=5'),
+        ('recommendations', f'/api/ai/recommendations/{products[0]["id"]}'),
+        ('outbox_stats', '/api/outbox/stats'),
+    ]
+    for name, url in reads:
+        for _ in range(args.reads):
+            timed(timings, name, client, 'GET', url)
+
+    # ---------- CONSISTENCY ----------
+    problems = []
+    stats = client.get('/api/outbox/stats').get_json()
+    if stats['pending'] or stats['dispatcher']['failed']:
+        problems.append(f"outbox not drained cleanly: {stats}")
+    ranking = client.get('/api/top_products?window=today&k=5&validate=1').get_json()
+    if not ranking['same_ranking']:
+        problems.append(f"top-k ranking differs from SQL: {ranking}")
+    with app.app_context():
+        cursor = db.cursor()
+        ids = list(sold)
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"SELECT id, stock_quantity FROM products WHERE id IN ({placeholders})", tuple(ids))
+        for row in cursor.fetchall():
+            if stock_before[row['id']] - sold[row['id']] != int(row['stock_quantity']):
+                problems.append(f"stock mismatch for product {row['id']}")
+        cursor.execute("""
+            SELECT (SELECT COALESCE(SUM(quantity), 0) FROM sales_daily_rollup) as rollup,
+                   (SELECT COALESCE(SUM(quantity), 0) FROM sale_items) as lines
+        """)
+        totals = cursor.fetchone()
+        if int(totals['rollup']) != int(totals['lines']):
+            problems.append(f"daily rollup {totals['rollup']} != sale lines {totals['lines']}")
+
+    print(f"backend={args.backend} sales={args.sales} reads/route={args.reads}")
+    print(f"{'route':<16}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}")
+    for name, values in timings.items():
+        print(f"{name:<16}{_pct(values, 0.5):>10.2f}{_pct(values, 0.95):>10.2f}{sum(values) / 1000:>10.2f}")
+    if problems:
+        raise SystemExit('\n'.join(['INCONSISTENT:'] + problems))
+    print('consistency checks passed')
+
+
+if __name__ == '__main__':
+    main()
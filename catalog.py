@@ -0,0 +1,389 @@
+"""
+Columnar product catalog snapshot shared by all gunicorn workers.
+
+The catalog is written once to a flat file (CATALOG_PATH) and every worker
+mmap()s it read-only, so product data lives once in the page cache instead
+of as per-process lists of DictCursor dicts with Decimal prices.
+
+File layout (little endian, every column 8-byte aligned):
+
+    header   magic, row count, string count, generation, built_at (unix time
+             of the last full rebuild; in-place patches leave it alone),
+             ticket of the last full rebuild
+    int64    id (ascending), selling_price, purchase_price   (prices in paise)
+    uint64   version (ticket of the row's last write)
+    int32    stock_quantity, min_stock_level, category_id (-1 = none)
+    uint32   name, name (lowercased), description, category_name (string indexes)
+    uint32   row order by name
+    uint64   string offsets (count + 1), then the UTF-8 string blob
+
+Writers hold an flock on CATALOG_PATH + '.lock' only to write, never across
+a database query. Each writer takes a ticket (a counter in the lock file)
+before reading the rows it will write, and every row keeps the ticket of its
+last write: a write from an earlier ticket never replaces one from a later
+ticket, so overlapping checkouts can never leave an older stock level last.
+Stock changes are patched in place (readers see them immediately through the
+shared mapping). Anything that touches names or adds/removes rows rebuilds
+the file and atomically replaces it, carrying over stock patched since its
+ticket, and readers remap when they notice the new inode. Rebuilds of a stale
+file are serialized by a second lock (CATALOG_PATH + '.rebuild.lock'), so the
+workers that notice together run one rebuild, not one each.
+"""
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+MAGIC = b'SSCAT\x00\x03\x00'
+HEADER = struct.Struct('<8sIIQdQ')
+GENERATION_OFFSET = 16
+TICKET = struct.Struct('<Q')
+
+# (name, array typecode, bytes per item)
+COLUMNS = [
+    ('id', 'q', 8), ('selling_price', 'q', 8), ('purchase_price', 'q', 8), ('version', 'Q', 8),
+    ('stock_quantity', 'i', 4), ('min_stock_level', 'i', 4), ('category_id', 'i', 4),
+    ('name', 'I', 4), ('name_lower', 'I', 4), ('description', 'I', 4), ('category_name', 'I', 4),
+    ('name_order', 'I', 4),
+]
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+def _layout(count, n_strings):
+    """Byte offset of every column, the string offsets and the blob"""
+    offsets = {}
+    pos = _align(HEADER.size)
+    for name, _, size in COLUMNS:
+        offsets[name] = pos
+        pos = _align(pos + count * size)
+    offsets['string_offsets'] = pos
+    offsets['blob'] = pos + (n_strings + 1) * 8
+    return offsets
+
+def _cents(value):
+    return int(round(float(value or 0) * 100))
+
+
+# ---------- WRITING ----------
+@contextmanager
+def _writer_lock(path):
+    """Host-wide writer lock; yields the lock file's fd (it also holds the ticket counter)"""
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def next_ticket(path):
+    """Take the next write ticket. Take it before reading the rows to write:
+    a higher ticket always read the database later, so it wins"""
+    with _writer_lock(path) as fd:
+        raw = os.pread(fd, TICKET.size, 0)
+        ticket = (TICKET.unpack(raw)[0] if len(raw) == TICKET.size else 0) + 1
+        os.pwrite(fd, TICKET.pack(ticket), 0)
+    return ticket
+
+def _encode(products, ticket):
+    """products: iterable of dicts with the catalog fields (+ category_name) -> file bytes"""
+    products = sorted(products, key=lambda p: p['id'])
+    strings, interned = [''], {'': 0}
+
+    def intern(value):
+        value = value or ''
+        if value not in interned:
+            interned[value] = len(strings)
+            strings.append(value)
+        return interned[value]
+
+    columns = {name: [] for name, _, _ in COLUMNS}
+    for p in products:
+        columns['id'].append(p['id'])
+        columns['selling_price'].append(_cents(p['selling_price']))
+        columns['purchase_price'].append(_cents(p['purchase_price']))
+        columns['version'].append(ticket)
+        columns['stock_quantity'].append(int(p['stock_quantity'] or 0))
+        columns['min_stock_level'].append(int(p['min_stock_level'] or 0))
+        columns['category_id'].append(p['category_id'] if p.get('category_id') is not None else -1)
+        columns['name'].append(intern(p['name']))
+        columns['name_lower'].append(intern((p['name'] or '').lower()))
+        columns['description'].append(intern(p.get('description')))
+        columns['category_name'].append(intern(p.get('category_name')))
+    columns['name_order'] = sorted(range(len(products)), key=lambda i: (products[i]['name'] or '').lower())
+
+    encoded = [s.encode('utf-8') for s in strings]
+    string_offsets = [0]
+    for s in encoded:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    offsets = _layout(len(products), len(strings))
+    buf = bytearray(offsets['blob'] + string_offsets[-1])
+    HEADER.pack_into(buf, 0, MAGIC, len(products), len(strings), 0, time.time(), ticket)
+    for name, code, _ in COLUMNS:
+        data = struct.pack(f'<{len(columns[name])}{code}', *columns[name])
+        buf[offsets[name]:offsets[name] + len(data)] = data
+    buf[offsets['string_offsets']:offsets['blob']] = struct.pack(f'<{len(string_offsets)}Q', *string_offsets)
+    buf[offsets['blob']:] = b''.join(encoded)
+    return buf
+
+def _stock_columns(buf):
+    """(ids, versions, stock) memoryviews over a file image; release them when done"""
+    _, count, n_strings, _, _, _ = HEADER.unpack_from(buf, 0)
+    offsets = _layout(count, n_strings)
+    view = memoryview(buf)
+    return [view[offsets[name]:offsets[name] + count * size].cast(code)
+            for name, code, size in COLUMNS if name in ('id', 'version', 'stock_quantity')]
+
+def _patch_stock(buf, updates):
+    """updates: {id: (stock_quantity, version)}, applied only over older versions.
+    Returns the ids that are not in the file"""
+    ids, versions, stock = _stock_columns(buf)
+    missing = []
+    try:
+        for product_id, (qty, version) in updates.items():
+            i = bisect.bisect_left(ids, product_id)
+            if i == len(ids) or ids[i] != product_id:
+                missing.append(product_id)
+            elif versions[i] < version:
+                stock[i] = int(qty)
+                versions[i] = version
+    finally:
+        ids.release()
+        versions.release()
+        stock.release()
+    return missing
+
+def _newer_stock(buf, ticket):
+    """{id: (stock_quantity, version)} for rows patched after `ticket`"""
+    ids, versions, stock = _stock_columns(buf)
+    try:
+        return {ids[i]: (stock[i], versions[i]) for i in range(len(ids)) if versions[i] > ticket}
+    finally:
+        ids.release()
+        versions.release()
+        stock.release()
+
+def write_snapshot(path, products, ticket=None):
+    """Replace the file with `products`, read from the database after taking `ticket`.
+
+    Encoding happens before the lock. Under it, a file built from a later read
+    is left alone, and stock patched in after our ticket is carried over."""
+    ticket = next_ticket(path) if ticket is None else ticket
+    buf = _encode(products, ticket)
+    with _writer_lock(path):
+        generation = 0
+        if built_at(path):
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as old:
+                generation, _, rebuilt_ticket = HEADER.unpack_from(old, 0)[3:]
+                if rebuilt_ticket > ticket:
+                    return False
+                _patch_stock(buf, _newer_stock(old, ticket))
+        struct.pack_into('<Q', buf, GENERATION_OFFSET, generation + 1)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(buf)
+        os.replace(tmp, path)
+    return True
+
+def _read_header(path):
+    """(generation, built_at), or (0, 0.0) for a missing or old-format file"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return 0, 0.0
+    if len(header) != HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return 0, 0.0
+    return HEADER.unpack(header)[3:5]
+
+def built_at(path):
+    """When the file was last fully rebuilt (0 if it needs a rebuild now)"""
+    return _read_header(path)[1]
+
+REBUILD_SQL = """
+    SELECT p.id, p.name, p.category_id, p.description, p.purchase_price, p.selling_price,
+           p.stock_quantity, p.min_stock_level, c.name as category_name
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+"""
+
+def rebuild(cursor, path):
+    """Full rebuild from the database (one query, run before taking the lock)"""
+    ticket = next_ticket(path)
+    cursor.execute(REBUILD_SQL)
+    write_snapshot(path, cursor.fetchall(), ticket)
+
+def is_stale(path, max_age):
+    """Missing, old-format, or last fully rebuilt more than max_age seconds ago"""
+    return time.time() - built_at(path) > max_age
+
+def claim_rebuild(path, max_age):
+    """One stale rebuild at a time per host (a separate lock, so checkouts never wait on it).
+    Blocks while another process rebuilds, then returns (fd, ticket) if the file is still
+    stale, or None if that rebuild already refreshed it"""
+    fd = os.open(path + '.rebuild.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    if not is_stale(path, max_age):
+        release_rebuild((fd, None))
+        return None
+    return fd, next_ticket(path)
+
+def release_rebuild(claim):
+    fcntl.flock(claim[0], fcntl.LOCK_UN)
+    os.close(claim[0])
+
+def rebuild_if_stale(cursor, path, max_age):
+    """Full rebuild unless another process did it while we waited; True if this call rebuilt"""
+    claim = claim_rebuild(path, max_age)
+    if claim is None:
+        return False
+    try:
+        cursor.execute(REBUILD_SQL)
+        write_snapshot(path, cursor.fetchall(), claim[1])
+    finally:
+        release_rebuild(claim)
+    return True
+
+def apply_stock(path, cursor, product_ids):
+    """Patch stock_quantity for existing ids in place; returns False if a rebuild is needed.
+    Call after commit. Stock is read before the lock; a row already patched from a
+    later read keeps its value"""
+    if not built_at(path):
+        return False
+    ticket = next_ticket(path)
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    cursor.execute(f"SELECT id, stock_quantity FROM products WHERE id IN ({placeholders})",
+                   tuple(product_ids))
+    updates = {row['id']: (row['stock_quantity'], ticket) for row in cursor.fetchall()}
+    if len(updates) != len(set(product_ids)):
+        return False
+
+    with _writer_lock(path):
+        if not built_at(path):
+            return False
+        with open(path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+            if _patch_stock(mm, updates):
+                return False
+            generation = HEADER.unpack_from(mm, 0)[3]
+            struct.pack_into('<Q', mm, GENERATION_OFFSET, generation + 1)
+    return True
+
+
+# ---------- READING ----------
+class CatalogSnapshot:
+    """Read-only, zero-copy view of the catalog file for one worker"""
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._inode = None
+        self._mm = None
+        self._checked = 0.0
+
+    def _map(self):
+        st = os.stat(self.path)
+        if st.st_ino == self._inode:
+            return
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, count, n_strings = HEADER.unpack_from(mm, 0)[:3]
+        offsets = _layout(count, n_strings)
+        view = memoryview(mm)
+        self.cols = {
+            name: view[offsets[name]:offsets[name] + count * size].cast(code)
+            for name, code, size in COLUMNS
+        }
+        self.string_offsets = view[offsets['string_offsets']:offsets['blob']].cast('Q')
+        self.blob = view[offsets['blob']:]
+        self.blob_start = offsets['blob']
+        self.count = count
+        # Old mapping is left to the garbage collector: rows handed out earlier
+        # are plain Python objects and never point into it
+        self._mm = mm
+        self._inode = st.st_ino
+
+    def refresh(self, force=False):
+        """Remap if the file was replaced; cheap enough to call per request"""
+        now = time.monotonic()
+        if not force and self._mm is not None and now - self._checked < self.CHECK_INTERVAL:
+            return self
+        with self._lock:
+            self._map()
+            self._checked = now
+        return self
+
+    @property
+    def available(self):
+        return os.path.exists(self.path)
+
+    def generation(self):
+        return HEADER.unpack_from(self._mm, 0)[3]
+
+    def string(self, index):
+        return bytes(self.blob[self.string_offsets[index]:self.string_offsets[index + 1]]).decode('utf-8')
+
+    def row(self, i):
+        """Hydrate row i into the same shape the DictCursor queries returned"""
+        c = self.cols
+        category_id = c['category_id'][i]
+        return {
+            'id': c['id'][i],
+            'name': self.string(c['name'][i]),
+            'category_id': None if category_id < 0 else category_id,
+            'category_name': self.string(c['category_name'][i]) or None,
+            'description': self.string(c['description'][i]),
+            'purchase_price': c['purchase_price'][i] / 100,
+            'selling_price': c['selling_price'][i] / 100,
+            'stock_quantity': c['stock_quantity'][i],
+            'min_stock_level': c['min_stock_level'][i],
+        }
+
+    def rows(self, order='name', in_stock=False, limit=None):
+        """order: 'name' (A-Z) or 'id_desc' (newest first)"""
+        if order == 'name':
+            indexes = self.cols['name_order']
+        else:
+            indexes = range(self.count - 1, -1, -1)
+        stock = self.cols['stock_quantity']
+        result = []
+        for i in indexes:
+            if in_stock and stock[i] <= 0:
+                continue
+            result.append(self.row(i))
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    def search(self, q, limit):
+        """Same filter as the SQL search: name contains q, or id == q; in stock only"""
+        # Find q in the string blob with mmap.find (C speed, no decoding), then
+        # map each hit back to the string that contains it
+        needle = q.lower().encode('utf-8')
+        matches = set()
+        pos = self._mm.find(needle, self.blob_start)
+        while needle and pos != -1:
+            rel = pos - self.blob_start
+            index = bisect.bisect_right(self.string_offsets, rel) - 1
+            if rel + len(needle) <= self.string_offsets[index + 1]:
+                matches.add(index)
+            pos = self._mm.find(needle, pos + 1)
+
+        wanted_id = int(q) if q.isascii() and q.isdigit() else None
+        ids, stock, names = self.cols['id'], self.cols['stock_quantity'], self.cols['name_lower']
+        result = []
+        for i in range(self.count):
+            if stock[i] > 0 and (names[i] in matches or ids[i] == wanted_id):
+                result.append(self.row(i))
+                if len(result) >= limit:
+                    break
+        return result
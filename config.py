@@ -15,6 +15,87 @@ class Config:
     
     MYSQL_CURSORCLASS = 'DictCursor'
     UPLOAD_FOLDER = 'uploads'
+
+    # Storage backend (see storage.py): 'mysql', or 'sqlite' for a single-store
+    # install with the database in one local file
+    DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'smart_stock.db')
+
+    # Sales partitioning / archival (see partitions.py)
+    ARCHIVE_DIR = os.getenv('SALES_ARCHIVE_DIR', 'archive')
+    PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+    PARTITION_RETENTION_MONTHS = int(os.getenv('PARTITION_RETENTION_MONTHS', 24))
+    RECENT_SALES_DAYS = int(os.getenv('RECENT_SALES_DAYS', 31))
+    RECOMMENDATION_DAYS = int(os.getenv('RECOMMENDATION_DAYS', 90))
+
+    # Rendered receipt cache (see receipts.py); set RECEIPT_CACHE_DIR to share across workers
+    RECEIPT_CACHE_SIZE = int(os.getenv('RECEIPT_CACHE_SIZE', 500))
+    RECEIPT_CACHE_DIR = os.getenv('RECEIPT_CACHE_DIR') or None
+    RECEIPT_BULK_LIMIT = int(os.getenv('RECEIPT_BULK_LIMIT', 500))
+
+    # Optional async read tier (see async_api.py; not started by Procfile)
+    ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 10))
+
+    # Gunicorn sync workers (read by gunicorn.conf.py as well)
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 4))
+
+    # Admission control (see admission.py). Routes not listed are critical and
+    # never gated; every best_effort route takes a class slot, plus a route
+    # slot when it has an ADMISSION_LIMITS entry.
+    # ADMISSION_BEST_EFFORT_LIMIT + ADMISSION_QUEUE_SIZE must stay below
+    # WEB_CONCURRENCY (checked at startup) so checkout always has a free worker.
+    ADMISSION_ROUTES = {
+        'main.create_sale': 'critical',
+        'main.search_products': 'critical',
+        'main.pos': 'critical',
+        'main.reports': 'best_effort',
+        'main.bulk_receipts': 'best_effort',
+        'main.get_recommendations': 'best_effort',
+        'main.optimize_stock': 'best_effort',
+        'main.price_strategy': 'best_effort',
+    }
+    ADMISSION_LIMITS = {
+        'main.reports': 1,
+        'main.bulk_receipts': 1,
+        'main.get_recommendations': 2,
+        'main.optimize_stock': 1,
+        'main.price_strategy': 1,
+    }
+    ADMISSION_BEST_EFFORT_LIMIT = int(os.getenv('ADMISSION_BEST_EFFORT_LIMIT', 2))
+    # Queued requests hold a worker while they wait; 0 = shed immediately
+    ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 0))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2.0))
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))
+    ADMISSION_DIR = os.getenv('ADMISSION_DIR', '/tmp/smart-stock-admission')
+
+    # Outbox dispatcher (see outbox.py). By default it runs as a thread in each
+    # web worker, so alerts keep flowing when only `web` is deployed. Set
+    # OUTBOX_INLINE=0 only when the `worker` process (`flask outbox run`) runs.
+    OUTBOX_INLINE = os.getenv('OUTBOX_INLINE', '1') == '1'
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1.0))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 10))
+    # A claimed batch is invisible to other dispatchers for this long
+    OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 600))
+    OUTBOX_WEBHOOK_URL = os.getenv('OUTBOX_WEBHOOK_URL') or None
+
+    # Top-selling products (see sketches.py): 'sketch' or 'sql' (exact GROUP BY).
+    # TOPK_EXACT=1 keeps exact per-hour counters in the tracker for validation.
+    TOPK_MODE = os.getenv('TOPK_MODE', 'sketch')
+    TOPK_CAPACITY = int(os.getenv('TOPK_CAPACITY', 64))
+    # Largest k /api/top_products accepts; in sketch mode also capped at
+    # TOPK_CAPACITY (Space-Saving says nothing about ranks beyond it)
+    TOPK_MAX_K = int(os.getenv('TOPK_MAX_K', 100))
+    TOPK_EXACT = os.getenv('TOPK_EXACT', '0') == '1'
+    TOPK_REFRESH_SECONDS = float(os.getenv('TOPK_REFRESH_SECONDS', 5))
+
+    # Shared product catalog snapshot (see catalog.py); rebuilt from MySQL when
+    # older than CATALOG_MAX_AGE seconds as a safety net for out-of-band edits
+    CATALOG_PATH = os.getenv('CATALOG_PATH', '/tmp/smart-stock-catalog.bin')
+    CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 300))
+
+    # Bulk stock counts (see stocktake.py)
+    STOCKTAKE_MAX_LINES = int(os.getenv('STOCKTAKE_MAX_LINES', 50000))
     
     @staticmethod
     def init_app(app):
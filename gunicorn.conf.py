@@ -0,0 +1,23 @@
+# Gunicorn settings (picked up automatically from the working directory)
+import os
+
+# Sync workers; admission control (admission.py) keeps best-effort routes
+# below this so checkout always finds a free one
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+
+# GUNICORN_PRELOAD=1 builds the app once in the master and forks workers
+# from it, so imports and templates are shared copy-on-write.
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+
+def on_starting(server):
+    if preload_app and os.getenv('GUNICORN_PRELOAD_AI', '0') == '1':
+        # Pay the Groq/httpx import once in the master instead of per worker
+        import groq  # noqa: F401
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # Network clients must not be shared across processes
+        from app import reset_after_fork
+        reset_after_fork(worker.app.wsgi())
@@ -0,0 +1,13 @@
+-- Snapshot the unit cost on every sale line so profit no longer depends on
+-- the current products.purchase_price (which changes via edit_product).
+-- Run once against the live database:  mysql smart_stock < migrations/001_sale_items_unit_cost.sql
+
+ALTER TABLE sale_items ADD COLUMN unit_cost DECIMAL(10,2) NULL AFTER unit_price;
+
+-- Backfill existing rows with today's cost (best we can do for history)
+UPDATE sale_items si
+LEFT JOIN products p ON si.product_id = p.id
+SET si.unit_cost = COALESCE(p.purchase_price, 0)
+WHERE si.unit_cost IS NULL;
+
+ALTER TABLE sale_items MODIFY unit_cost DECIMAL(10,2) NOT NULL DEFAULT 0;
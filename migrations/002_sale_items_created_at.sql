@@ -0,0 +1,17 @@
+-- Copy the sale timestamp onto every sale line so sale_items can be
+-- partitioned by month alongside sales (see partitions.py).
+-- Run once, then:  flask partitions init
+-- (init widens unique keys such as sales.invoice_no to include created_at;
+-- the original columns stay unique via <table>_<key>_unique guard tables.)
+
+ALTER TABLE sale_items ADD COLUMN created_at DATETIME NULL;
+
+UPDATE sale_items si
+JOIN sales s ON si.sale_id = s.id
+SET si.created_at = s.created_at
+WHERE si.created_at IS NULL;
+
+ALTER TABLE sale_items MODIFY created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX idx_sale_items_sale ON sale_items (sale_id, created_at);
+CREATE INDEX idx_sale_items_product ON sale_items (product_id, created_at);
+CREATE INDEX idx_sales_created ON sales (created_at);
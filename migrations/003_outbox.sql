@@ -0,0 +1,32 @@
+-- Transactional outbox for work derived from a sale (see outbox.py).
+-- Run once, then start the dispatcher:  flask outbox run
+
+CREATE TABLE outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    available_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    processed_at DATETIME NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    last_error VARCHAR(1000) NULL,
+    INDEX idx_outbox_pending (processed_at, available_at, id)
+);
+
+-- One row per (event, handler) that has been applied; makes retries idempotent
+CREATE TABLE outbox_deliveries (
+    event_id BIGINT NOT NULL,
+    handler VARCHAR(50) NOT NULL,
+    delivered_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (event_id, handler)
+);
+
+-- Filled by the 'analytics' handler
+CREATE TABLE sales_daily_rollup (
+    day DATE NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+    cost DECIMAL(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+);
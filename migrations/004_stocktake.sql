@@ -0,0 +1,23 @@
+-- Stock counting sessions and per-line adjustments (see stocktake.py).
+-- Run once before using POST /api/stocktake.
+
+CREATE TABLE stocktakes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    mode VARCHAR(10) NOT NULL,
+    reason VARCHAR(255) NULL,
+    user_id INT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per counted product: what the system expected and what was found
+CREATE TABLE stock_adjustments (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    stocktake_id INT NOT NULL,
+    product_id INT NOT NULL,
+    expected INT NOT NULL,
+    counted INT NOT NULL,
+    reason VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_stock_adjustments_line (stocktake_id, product_id),
+    INDEX idx_stock_adjustments_product (product_id, created_at)
+);
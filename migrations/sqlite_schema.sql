@@ -0,0 +1,113 @@
+-- Schema for the embedded SQLite backend (DB_BACKEND=sqlite, see storage.py).
+-- Same tables and columns as the MySQL database after migrations 001-004;
+-- applied automatically (IF NOT EXISTS) whenever a connection is opened.
+-- Timestamps default to local time to match MySQL's NOW().
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    role VARCHAR(20) NOT NULL DEFAULT 'staff',
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    description TEXT,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(200) NOT NULL,
+    category_id INTEGER REFERENCES categories (id),
+    description TEXT,
+    purchase_price DECIMAL(10,2) NOT NULL DEFAULT 0,
+    selling_price DECIMAL(10,2) NOT NULL DEFAULT 0,
+    stock_quantity INTEGER NOT NULL DEFAULT 0,
+    min_stock_level INTEGER NOT NULL DEFAULT 5,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    updated_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products (category_id);
+
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    invoice_no VARCHAR(50) NOT NULL,
+    total_amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+    payment_mode VARCHAR(20) NOT NULL DEFAULT 'cash',
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_sales_created ON sales (created_at);
+
+CREATE TABLE IF NOT EXISTS sale_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sale_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    unit_price DECIMAL(10,2) NOT NULL,
+    unit_cost DECIMAL(10,2) NOT NULL DEFAULT 0,
+    subtotal DECIMAL(12,2) NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items (sale_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_sale_items_product ON sale_items (product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_sale_items_created ON sale_items (created_at);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    message VARCHAR(255) NOT NULL,
+    is_resolved BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_product ON alerts (product_id, is_resolved);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    available_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    processed_at DATETIME NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error VARCHAR(1000) NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (processed_at, available_at, id);
+
+CREATE TABLE IF NOT EXISTS outbox_deliveries (
+    event_id INTEGER NOT NULL,
+    handler VARCHAR(50) NOT NULL,
+    delivered_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (event_id, handler)
+);
+
+CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+    day DATE NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+    cost DECIMAL(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS stocktakes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mode VARCHAR(10) NOT NULL,
+    reason VARCHAR(255) NULL,
+    user_id INTEGER NULL,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS stock_adjustments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stocktake_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    expected INTEGER NOT NULL,
+    counted INTEGER NOT NULL,
+    reason VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    UNIQUE (stocktake_id, product_id)
+);
+CREATE INDEX IF NOT EXISTS idx_stock_adjustments_product ON stock_adjustments (product_id, created_at);
@@ -0,0 +1,282 @@
+"""
+Transactional outbox.
+
+create_sale writes one `outbox` row inside the sale transaction and returns
+as soon as the sale and stock change commit. A dispatcher (an in-process thread
+per web worker by default, or `flask outbox run` with OUTBOX_INLINE=0) drains
+the table in batches and runs the registered handlers for each event.
+
+Delivery is at-least-once. Each (event, handler) pair is recorded in
+outbox_deliveries in the SAME transaction as the handler's own writes, so a
+retried event never applies a database handler twice. Handlers with external
+side effects (external=True) get the event id to use as an idempotency key.
+
+No transaction stays open across a batch: the dispatcher claims a batch and
+leases it (available_at pushed OUTBOX_LEASE_SECONDS ahead) in one short
+transaction, then commits each event's database handlers on their own, and
+only then calls external handlers, holding no locks while it waits on them.
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from datetime import date, datetime
+from decimal import Decimal
+
+import click
+from flask import current_app
+
+from storage import db
+
+# name -> (event types, fn(cursor, event), external)
+HANDLERS = {}
+
+
+def handler(name, *event_types, external=False):
+    """external=True: side effects outside the database, run after commit"""
+    def register(fn):
+        HANDLERS[name] = (event_types, fn, external)
+        return fn
+    return register
+
+
+# ---------- WRITING ----------
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(' ')
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+def publish(cursor, event_type, payload):
+    """Queue an event; call inside the transaction that produced it"""
+    cursor.execute("INSERT INTO outbox (event_type, payload) VALUES (%s, %s)",
+                   (event_type, json.dumps(payload, default=_json_default)))
+
+
+# ---------- HANDLERS ----------
+@handler('alerts', 'sale_created')
+def evaluate_alerts(cursor, event):
+    """Create or refresh low-stock alerts for every product in the sale"""
+    ids = [item['product_id'] for item in event['payload']['items']]
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"""
+        SELECT p.id, p.stock_quantity, p.min_stock_level, a.id as alert_id
+        FROM products p
+        LEFT JOIN alerts a ON a.product_id = p.id AND a.is_resolved = FALSE
+        WHERE p.id IN ({placeholders}) AND p.stock_quantity <= p.min_stock_level
+    """, tuple(ids))
+
+    for prod in cursor.fetchall():
+        alert_msg = f"Low stock: {prod['stock_quantity']} units remaining (Min: {prod['min_stock_level']})"
+        if prod['alert_id']:
+            cursor.execute("UPDATE alerts SET message = %s WHERE id = %s", (alert_msg, prod['alert_id']))
+        else:
+            cursor.execute("INSERT INTO alerts (product_id, message) VALUES (%s, %s)", (prod['id'], alert_msg))
+
+@handler('analytics', 'sale_created')
+def update_daily_rollup(cursor, event):
+    """Per-day, per-product quantity / revenue / cost totals for reports"""
+    sale = event['payload']
+    if db.dialect == 'sqlite':
+        upsert = """ON CONFLICT (day, product_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                revenue = revenue + excluded.revenue,
+                                cost = cost + excluded.cost"""
+    else:
+        upsert = """ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity),
+                                revenue = revenue + VALUES(revenue),
+                                cost = cost + VALUES(cost)"""
+    cursor.execute(f"""
+        INSERT INTO sales_daily_rollup (day, product_id, quantity, revenue, cost)
+        SELECT DATE(created_at), product_id, SUM(quantity), SUM(subtotal), SUM(unit_cost * quantity)
+        FROM sale_items
+        WHERE sale_id = %s AND created_at = %s
+        GROUP BY DATE(created_at), product_id
+        {upsert}
+    """, (sale['sale_id'], sale['created_at']))
+
+@handler('notifications', 'sale_created', external=True)
+def notify_webhook(cursor, event):
+    """POST the sale to OUTBOX_WEBHOOK_URL, if configured"""
+    url = current_app.config['OUTBOX_WEBHOOK_URL']
+    if not url:
+        return
+    body = json.dumps({'event_id': event['id'], 'type': event['event_type'], **event['payload']}).encode()
+    req = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'Idempotency-Key': f"outbox-{event['id']}",
+    })
+    urllib.request.urlopen(req, timeout=5).close()
+
+
+# ---------- DISPATCHER ----------
+class Dispatcher:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config['OUTBOX_BATCH_SIZE']
+        self.max_attempts = app.config['OUTBOX_MAX_ATTEMPTS']
+        self.lease_seconds = app.config['OUTBOX_LEASE_SECONDS']
+        self.stats = {'dispatched': 0, 'failed': 0, 'batches': 0, 'last_batch_ms': 0.0, 'last_run': None}
+
+    def _claim_batch(self, cursor):
+        # SKIP LOCKED lets several dispatchers drain the same table safely; the
+        # lease keeps the batch ours after the row locks are released
+        cursor.execute("""
+            SELECT id, event_type, payload, attempts, created_at
+            FROM outbox
+            WHERE processed_at IS NULL AND available_at <= NOW() AND attempts < %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (self.max_attempts, self.batch_size))
+        events = cursor.fetchall()
+        if events:
+            placeholders = ', '.join(['%s'] * len(events))
+            cursor.execute(f"UPDATE outbox SET available_at = NOW() + INTERVAL %s SECOND WHERE id IN ({placeholders})",
+                           (self.lease_seconds, *[event['id'] for event in events]))
+        db.commit()
+        return events
+
+    def _deliver(self, cursor, event, name, fn):
+        cursor.execute("SAVEPOINT delivery")
+        cursor.execute("INSERT IGNORE INTO outbox_deliveries (event_id, handler) VALUES (%s, %s)",
+                       (event['id'], name))
+        if cursor.rowcount == 0:
+            return  # already applied by an earlier attempt
+        try:
+            fn(cursor, event)
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT delivery")
+            raise
+
+    def _deliver_external(self, cursor, event, name, fn):
+        cursor.execute("SELECT 1 FROM outbox_deliveries WHERE event_id = %s AND handler = %s",
+                       (event['id'], name))
+        done = cursor.fetchone()
+        db.commit()  # no transaction open while we wait on the outside world
+        if done:
+            return
+        fn(cursor, event)
+        cursor.execute("INSERT IGNORE INTO outbox_deliveries (event_id, handler) VALUES (%s, %s)",
+                       (event['id'], name))
+        db.commit()
+
+    def _process(self, cursor, event):
+        """Run every handler for one event; returns the error messages"""
+        handlers = [(name, fn, external) for name, (event_types, fn, external) in HANDLERS.items()
+                    if event['event_type'] in event_types]
+        errors = []
+
+        # 1. Database handlers, one short transaction per event
+        for name, fn, external in handlers:
+            if not external:
+                try:
+                    self._deliver(cursor, event, name, fn)
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+        db.commit()
+
+        # 2. External side effects, after commit
+        for name, fn, external in handlers:
+            if external:
+                try:
+                    self._deliver_external(cursor, event, name, fn)
+                except Exception as e:
+                    db.rollback()
+                    errors.append(f"{name}: {e}")
+        return errors
+
+    def run_once(self):
+        """Drain one batch; returns the number of events processed"""
+        db.ping()
+        cursor = db.cursor()
+        started = time.perf_counter()
+
+        events = self._claim_batch(cursor)
+        for event in events:
+            event['payload'] = json.loads(event['payload'])
+            errors = self._process(cursor, event)
+
+            if errors:
+                # Retry later with linear backoff; successful handlers stay recorded
+                cursor.execute("""
+                    UPDATE outbox SET attempts = attempts + 1, last_error = %s,
+                           available_at = NOW() + INTERVAL (attempts * 10) SECOND
+                    WHERE id = %s
+                """, ('; '.join(errors)[:1000], event['id']))
+                self.stats['failed'] += 1
+            else:
+                cursor.execute("UPDATE outbox SET processed_at = NOW() WHERE id = %s", (event['id'],))
+                self.stats['dispatched'] += 1
+            db.commit()
+
+        if events:
+            self.stats['batches'] += 1
+            self.stats['last_batch_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self.stats['last_run'] = datetime.now().isoformat(timespec='seconds')
+        return len(events)
+
+    def run_forever(self):
+        interval = self.app.config['OUTBOX_POLL_INTERVAL']
+        with self.app.app_context():
+            while True:
+                try:
+                    if self.run_once() < self.batch_size:
+                        time.sleep(interval)
+                except Exception as e:
+                    print(f"Outbox dispatcher error: {str(e)}")
+                    try:
+                        db.rollback()
+                    except Exception:
+                        pass
+                    time.sleep(interval)
+
+
+def lag_metrics(cursor):
+    """Backlog size and age of the oldest undelivered event; dead events are counted apart"""
+    cursor.execute("""
+        SELECT COUNT(*) as pending,
+               COALESCE(TIMESTAMPDIFF(SECOND, MIN(created_at), NOW()), 0) as lag_seconds,
+               COALESCE(SUM(attempts > 0), 0) as retrying
+        FROM outbox
+        WHERE processed_at IS NULL AND attempts < %s
+    """, (current_app.config['OUTBOX_MAX_ATTEMPTS'],))
+    pending = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*) as dead FROM outbox WHERE processed_at IS NULL AND attempts >= %s",
+                   (current_app.config['OUTBOX_MAX_ATTEMPTS'],))
+    return {key: int(value) for key, value in {**pending, **cursor.fetchone()}.items()}
+
+
+# ---------- WIRING ----------
+def init_outbox(app):
+    dispatcher = Dispatcher(app)
+    app.extensions['outbox'] = dispatcher
+
+    if app.config['OUTBOX_INLINE']:
+        # One daemon thread per worker process, started lazily so it survives
+        # gunicorn's fork when the app is preloaded
+        started = {'pid': None}
+
+        @app.before_request
+        def start_inline_dispatcher():
+            if started['pid'] != os.getpid():
+                started['pid'] = os.getpid()
+                threading.Thread(target=dispatcher.run_forever, daemon=True).start()
+
+    @app.cli.group('outbox')
+    def outbox_cli():
+        """Outbox dispatcher."""
+
+    @outbox_cli.command('run')
+    def run_command():
+        """Drain the outbox forever (run as a separate process)."""
+        click.echo(f"Dispatching handlers: {', '.join(HANDLERS)}")
+        dispatcher.run_forever()
+
+    @outbox_cli.command('stats')
+    def stats_command():
+        """Print backlog and lag."""
+        click.echo(json.dumps(lag_metrics(db.cursor())))
+
+    return dispatcher
@@ -0,0 +1,306 @@
+"""
+Monthly partition maintenance and archival for sales / sale_items.
+
+Both tables are RANGE COLUMNS partitioned on created_at, one partition per
+month plus a catch-all `pmax`. Schedule `flask partitions maintain` daily
+(Railway cron / crontab) to keep future months created and to move months
+older than the retention window into gzip'd JSON-lines files under ARCHIVE_DIR.
+Archived months can still be read back with `flask partitions export`.
+"""
+import csv
+import glob
+import gzip
+import json
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+import click
+
+from storage import db
+
+PARTITIONED_TABLES = ('sales', 'sale_items')
+
+
+# ---------- DATE HELPERS ----------
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+def add_months(d, n):
+    month = d.month - 1 + n
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+def partition_name(d):
+    return f"p{d:%Y%m}"
+
+def parse_month(value):
+    """'2025-01' -> date(2025, 1, 1)"""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+# ---------- PARTITION INFO ----------
+def list_partitions(cursor, table):
+    """Return the partition names of a table in order (empty if not partitioned)"""
+    cursor.execute("""
+        SELECT PARTITION_NAME as name
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [row['name'] for row in cursor.fetchall()]
+
+def _partition_months(names):
+    return sorted(parse_month(f"{n[1:5]}-{n[5:7]}") for n in names if n != 'pmax')
+
+def _partition_clause(d):
+    return f"PARTITION {partition_name(d)} VALUES LESS THAN ('{add_months(d, 1):%Y-%m-%d}')"
+
+
+# ---------- ONE-TIME CONVERSION ----------
+def _guard_unique_key(cursor, table, name, columns):
+    """Keep `columns` unique across all partitions.
+
+    A plain (non-partitioned) table holds one row per key value under the
+    original UNIQUE KEY, and BEFORE INSERT / UPDATE triggers on the
+    partitioned table write to it, so a duplicate fails the insert with the
+    usual duplicate-key error. Rows stay when a month is archived and
+    dropped, so archived values remain taken.
+    """
+    guard = f"{table}_{name}_unique"
+    cols = ', '.join(f"`{c}`" for c in columns)
+    new = ', '.join(f"NEW.`{c}`" for c in columns)
+    changed = ' OR '.join(f"NOT (NEW.`{c}` <=> OLD.`{c}`)" for c in columns)
+    same_as_old = ' AND '.join(f"`{c}` <=> OLD.`{c}`" for c in columns)
+
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS `{guard}` (UNIQUE KEY `{name}` ({cols})) "
+                   f"SELECT {cols} FROM `{table}`")
+    cursor.execute(f"""
+        CREATE TRIGGER `{guard}_ins` BEFORE INSERT ON `{table}` FOR EACH ROW
+        INSERT INTO `{guard}` ({cols}) VALUES ({new})
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER `{guard}_upd` BEFORE UPDATE ON `{table}` FOR EACH ROW
+        BEGIN
+            IF {changed} THEN
+                DELETE FROM `{guard}` WHERE {same_as_old} LIMIT 1;
+                INSERT INTO `{guard}` ({cols}) VALUES ({new});
+            END IF;
+        END
+    """)
+
+def partition_tables(cursor, months_ahead=3):
+    """Convert sales / sale_items into monthly partitioned tables.
+
+    Needs migrations/002_sale_items_created_at.sql applied first. InnoDB does
+    not allow foreign keys on partitioned tables and every unique key must
+    contain the partition column, so those are rebuilt here. A unique key
+    widened to (cols..., created_at) would no longer stop duplicates (e.g. a
+    repeated sales.invoice_no), so the original columns stay unique through
+    a guard table (see _guard_unique_key). Returns the guarded keys.
+    """
+    guarded = []
+    cursor.execute("SELECT MIN(created_at) as first FROM sales")
+    first = cursor.fetchone()['first'] or datetime.now()
+    last = add_months(month_start(date.today()), months_ahead)
+
+    for table in PARTITIONED_TABLES:
+        if list_partitions(cursor, table):
+            continue
+
+        # 1. Drop foreign keys pointing from or to this table
+        cursor.execute("""
+            SELECT TABLE_NAME as tbl, CONSTRAINT_NAME as name
+            FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE()
+            AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+        """, (table, table))
+        for fk in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE `{fk['tbl']}` DROP FOREIGN KEY `{fk['name']}`")
+
+        # 2. Unique keys must include created_at
+        cursor.execute("""
+            SELECT INDEX_NAME as name, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX) as cols
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            AND NON_UNIQUE = 0 AND INDEX_NAME != 'PRIMARY'
+            GROUP BY INDEX_NAME
+        """, (table,))
+        for idx in cursor.fetchall():
+            columns = idx['cols'].split(',')
+            cols = ', '.join(f"`{c}`" for c in columns)
+            _guard_unique_key(cursor, table, idx['name'], columns)
+            guarded.append(f"{table}.{idx['name']} ({', '.join(columns)})")
+            cursor.execute(f"ALTER TABLE `{table}` DROP INDEX `{idx['name']}`, "
+                           f"ADD UNIQUE KEY `{idx['name']}` ({cols}, created_at)")
+
+        # 3. Primary key on (id, created_at), then split by month
+        cursor.execute(f"""
+            ALTER TABLE `{table}`
+            MODIFY created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)
+        """)
+        month = month_start(first)
+        clauses = []
+        while month <= last:
+            clauses.append(_partition_clause(month))
+            month = add_months(month, 1)
+        clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        cursor.execute(f"ALTER TABLE `{table}` PARTITION BY RANGE COLUMNS(created_at) ({', '.join(clauses)})")
+    return guarded
+
+
+# ---------- MAINTENANCE ----------
+def ensure_future_partitions(cursor, months_ahead=3):
+    """Split pmax so partitions exist for the current month + months_ahead"""
+    created = []
+    target = add_months(month_start(date.today()), months_ahead)
+    for table in PARTITIONED_TABLES:
+        months = _partition_months(list_partitions(cursor, table))
+        if not months:
+            continue
+        month = add_months(months[-1], 1)
+        clauses = []
+        while month <= target:
+            clauses.append(_partition_clause(month))
+            created.append(f"{table}.{partition_name(month)}")
+            month = add_months(month, 1)
+        if clauses:
+            clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+            cursor.execute(f"ALTER TABLE `{table}` REORGANIZE PARTITION pmax INTO ({', '.join(clauses)})")
+    return created
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+def archive_file(archive_dir, month):
+    return os.path.join(archive_dir, f"sales-{month:%Y-%m}.jsonl.gz")
+
+def archive_month(cursor, month, archive_dir):
+    """Write one month of sales (with nested items) to a gzip'd JSON-lines file"""
+    name = partition_name(month)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    cursor.execute(f"SELECT * FROM sales PARTITION ({name}) ORDER BY id")
+    sales = cursor.fetchall()
+    cursor.execute(f"SELECT * FROM sale_items PARTITION ({name}) ORDER BY sale_id, id")
+    items_by_sale = {}
+    for item in cursor.fetchall():
+        items_by_sale.setdefault(item['sale_id'], []).append(item)
+
+    # Write to a temp file first so a crash never leaves a half archive behind
+    path = archive_file(archive_dir, month)
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        for sale in sales:
+            sale['items'] = items_by_sale.get(sale['id'], [])
+            f.write(json.dumps(sale, default=_json_default) + '\n')
+    os.replace(path + '.tmp', path)
+    return path, len(sales)
+
+def drop_old_partitions(cursor, retention_months, archive_dir=None):
+    """Archive (optional) and drop every month older than the retention window"""
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    dropped = []
+    for month in _partition_months(list_partitions(cursor, 'sales')):
+        if month >= cutoff:
+            break
+        if archive_dir:
+            archive_month(cursor, month, archive_dir)
+        for table in ('sale_items', 'sales'):
+            if partition_name(month) in list_partitions(cursor, table):
+                cursor.execute(f"ALTER TABLE `{table}` DROP PARTITION {partition_name(month)}")
+        dropped.append(partition_name(month))
+    return dropped
+
+
+# ---------- ARCHIVE READING ----------
+def read_archive(archive_dir, start=None, end=None):
+    """Yield archived sales between two dates (inclusive), oldest month first"""
+    for path in sorted(glob.glob(os.path.join(archive_dir, 'sales-*.jsonl.gz'))):
+        month = parse_month(os.path.basename(path)[6:13])
+        if start and add_months(month, 1) <= start:
+            continue
+        if end and month > end:
+            continue
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                sale = json.loads(line)
+                sale_day = datetime.fromisoformat(sale['created_at']).date()
+                if (start and sale_day < start) or (end and sale_day > end):
+                    continue
+                yield sale
+
+
+# ---------- CLI ----------
+def _mysql_cursor():
+    # Partitioning is a MySQL feature; single-store SQLite files stay small
+    if db.dialect != 'mysql':
+        raise click.ClickException(f"partitions are only supported on MySQL (DB_BACKEND={db.dialect})")
+    return db.cursor()
+
+def register_cli(app):
+    @app.cli.group('partitions')
+    def partitions_cli():
+        """Manage monthly sales partitions and archives."""
+
+    @partitions_cli.command('init')
+    def init_command():
+        """One-time conversion of sales / sale_items to monthly partitions."""
+        cursor = _mysql_cursor()
+        guarded = partition_tables(cursor, app.config['PARTITION_MONTHS_AHEAD'])
+        db.commit()
+        click.echo('✅ sales and sale_items are now partitioned by month')
+        for key in guarded:
+            click.echo(f"Unique key {key} is kept unique by a guard table + triggers")
+
+    @partitions_cli.command('maintain')
+    @click.option('--no-archive', is_flag=True, help='Drop old months without archiving them.')
+    def maintain_command(no_archive):
+        """Create future partitions and archive/drop expired ones."""
+        cursor = _mysql_cursor()
+        created = ensure_future_partitions(cursor, app.config['PARTITION_MONTHS_AHEAD'])
+        dropped = drop_old_partitions(cursor, app.config['PARTITION_RETENTION_MONTHS'],
+                                      None if no_archive else app.config['ARCHIVE_DIR'])
+        db.commit()
+        click.echo(f"Created: {', '.join(created) or 'none'}")
+        click.echo(f"Archived/dropped: {', '.join(dropped) or 'none'}")
+
+    @partitions_cli.command('archive')
+    @click.argument('month')
+    def archive_command(month):
+        """Write MONTH (YYYY-MM) to the archive without dropping it."""
+        cursor = _mysql_cursor()
+        path, count = archive_month(cursor, parse_month(month), app.config['ARCHIVE_DIR'])
+        click.echo(f"Wrote {count} sales to {path}")
+
+    @partitions_cli.command('export')
+    @click.option('--from', 'start', type=click.DateTime(['%Y-%m-%d']), help='First day (inclusive).')
+    @click.option('--to', 'end', type=click.DateTime(['%Y-%m-%d']), help='Last day (inclusive).')
+    @click.option('--invoice', help='Only this invoice number.')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv')
+    def export_command(start, end, invoice, fmt):
+        """Export archived sales to stdout as CSV (one row per item) or JSON lines."""
+        sales = read_archive(app.config['ARCHIVE_DIR'],
+                             start.date() if start else None,
+                             end.date() if end else None)
+        if fmt == 'jsonl':
+            for sale in sales:
+                if not invoice or sale['invoice_no'] == invoice:
+                    sys.stdout.write(json.dumps(sale) + '\n')
+            return
+
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['sale_id', 'invoice_no', 'created_at', 'payment_mode', 'total_amount',
+                         'product_id', 'quantity', 'unit_price', 'unit_cost', 'subtotal'])
+        for sale in sales:
+            if invoice and sale['invoice_no'] != invoice:
+                continue
+            for item in sale['items']:
+                writer.writerow([sale['id'], sale['invoice_no'], sale['created_at'], sale['payment_mode'],
+                                 sale['total_amount'], item['product_id'], item['quantity'],
+                                 item['unit_price'], item.get('unit_cost'), item['subtotal']])
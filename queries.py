@@ -0,0 +1,97 @@
+"""
+SQL and row shaping for the hot read APIs.
+
+Shared by the Flask routes in app.py and the asyncio handlers in async_api.py
+so both tiers return identical JSON. Each *_query() returns (sql, params);
+product search reads the mmap()ed catalog snapshot instead.
+"""
+
+SEARCH_LIMIT = 10
+BROWSE_LIMIT = 20
+RECENT_SALES_LIMIT = 10
+
+
+# ---------- PRODUCT SEARCH ----------
+def search_products(catalog, q):
+    """Served from the shared catalog snapshot (catalog.py) by both tiers, not SQL"""
+    if q:
+        return catalog.search(q, SEARCH_LIMIT)
+    return catalog.rows(in_stock=True, limit=BROWSE_LIMIT)
+
+
+# ---------- RECENT SALES ----------
+def recent_sales_query(days):
+    # Bounded window so only the newest partitions are scanned
+    return """
+        SELECT s.*,
+               (SELECT COUNT(*) FROM sale_items
+                WHERE sale_id = s.id AND created_at = s.created_at) as item_count
+        FROM sales s
+        WHERE s.created_at >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+        ORDER BY s.created_at DESC
+        LIMIT %s
+    """, (days, RECENT_SALES_LIMIT)
+
+def shape_sales(sales):
+    for sale in sales:
+        # 1. Fix Decimal (for total_amount)
+        if 'total_amount' in sale and sale['total_amount'] is not None:
+            sale['total_amount'] = float(sale['total_amount'])
+
+        # 2. FIX: Convert datetime to string (Critical for JSON)
+        if 'created_at' in sale and sale['created_at'] is not None:
+            # Format: '2023-10-27 14:30:00'
+            sale['created_at'] = sale['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+    return list(sales)
+
+
+# ---------- RECOMMENDATIONS ----------
+def recommendations_query(product_id, days):
+    # AI Query: Find other products that appear in the same 'sale_id' as the current product
+    return """
+        SELECT p.id, p.name, p.selling_price, p.stock_quantity, COUNT(*) as frequency
+        FROM sale_items si1
+        JOIN sale_items si2 ON si1.sale_id = si2.sale_id AND si1.created_at = si2.created_at
+        JOIN products p ON si2.product_id = p.id
+        WHERE si1.product_id = %s
+        AND si2.product_id != %s
+        AND si1.created_at >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+        AND p.stock_quantity > 0
+        GROUP BY p.id
+        ORDER BY frequency DESC
+        LIMIT 1
+    """, (product_id, product_id, days)
+
+def shape_recommendation(suggestion):
+    if suggestion:
+        suggestion['selling_price'] = float(suggestion['selling_price'])
+        return [suggestion]
+    return []
+
+
+# ---------- TOP SELLERS ----------
+def top_products_query(since, k):
+    """Exact top-k by quantity sold since a datetime (fallback / validation for sketches.py).
+    Revenue and profit come from the sale lines, not today's product prices"""
+    return """
+        SELECT p.id, p.name, p.selling_price, p.purchase_price, c.name as category_name,
+               SUM(si.quantity) as total_sold, SUM(si.subtotal) as revenue,
+               SUM((si.unit_price - si.unit_cost) * si.quantity) as profit
+        FROM sale_items si
+        JOIN products p ON si.product_id = p.id
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE si.created_at >= %s
+        GROUP BY p.id, p.name, p.selling_price, p.purchase_price, c.name
+        ORDER BY total_sold DESC
+        LIMIT %s
+    """, (since, k)
+
+def product_totals_query(since, product_ids):
+    """Exact quantity, revenue and profit since a datetime for specific products"""
+    return f"""
+        SELECT product_id as id, SUM(quantity) as total_sold, SUM(subtotal) as revenue,
+               SUM((unit_price - unit_cost) * quantity) as profit
+        FROM sale_items
+        WHERE created_at >= %s AND product_id IN ({', '.join(['%s'] * len(product_ids))})
+        GROUP BY product_id
+    """, (since, *product_ids)
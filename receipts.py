@@ -0,0 +1,139 @@
+"""
+Rendered-receipt cache.
+
+A completed sale never changes, so the receipt HTML for a sale_id is rendered
+once (at checkout) and served from an in-memory LRU, optionally backed by a
+directory of files shared between workers and restarts.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+
+
+class ReceiptCache:
+    def __init__(self, max_items=500, disk_dir=None):
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, sale_id):
+        return os.path.join(self.disk_dir, f"{int(sale_id)}.json")
+
+    def get(self, sale_id):
+        """Return {'invoice_no', 'html'} or None"""
+        with self._lock:
+            receipt = self._items.get(sale_id)
+            if receipt is not None:
+                self._items.move_to_end(sale_id)
+                return receipt
+
+        if self.disk_dir and os.path.exists(self._path(sale_id)):
+            with open(self._path(sale_id), encoding='utf-8') as f:
+                receipt = json.load(f)
+            self._remember(sale_id, receipt)
+            return receipt
+        return None
+
+    def put(self, sale_id, receipt):
+        self._remember(sale_id, receipt)
+        if self.disk_dir:
+            # Write then rename so other workers never read a partial file
+            tmp = f"{self._path(sale_id)}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(receipt, f)
+            os.replace(tmp, self._path(sale_id))
+
+    def _remember(self, sale_id, receipt):
+        with self._lock:
+            self._items[sale_id] = receipt
+            self._items.move_to_end(sale_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+
+# ---------- BATCHED LOADING ----------
+def _attach_items(cursor, sales):
+    """Load the items of many sales with ONE query and render each receipt"""
+    if not sales:
+        return {}
+
+    ids = [s['id'] for s in sales]
+    placeholders = ', '.join(['%s'] * len(ids))
+    # created_at range lets MySQL prune sale_items partitions
+    cursor.execute(f"""
+        SELECT si.*, COALESCE(p.name, 'Deleted Product') as product_name
+        FROM sale_items si
+        LEFT JOIN products p ON si.product_id = p.id
+        WHERE si.sale_id IN ({placeholders})
+        AND si.created_at BETWEEN %s AND %s
+        ORDER BY si.sale_id, si.id
+    """, (*ids, min(s['created_at'] for s in sales), max(s['created_at'] for s in sales)))
+
+    items_by_sale = {}
+    for item in cursor.fetchall():
+        items_by_sale.setdefault(item['sale_id'], []).append(item)
+
+    return {
+        sale['id']: {
+            'invoice_no': sale['invoice_no'],
+            'html': render_template('_receipt.html', sale=sale, items=items_by_sale.get(sale['id'], [])),
+        }
+        for sale in sales
+    }
+
+def render_receipts(cursor, cache, sale_ids):
+    """Return {sale_id: receipt} using the cache, loading the misses in one query pair"""
+    receipts = {}
+    missing = []
+    for sale_id in sale_ids:
+        receipt = cache.get(sale_id)
+        if receipt:
+            receipts[sale_id] = receipt
+        else:
+            missing.append(sale_id)
+
+    if missing:
+        placeholders = ', '.join(['%s'] * len(missing))
+        cursor.execute(f"SELECT * FROM sales WHERE id IN ({placeholders})", tuple(missing))
+        for sale_id, receipt in _attach_items(cursor, cursor.fetchall()).items():
+            cache.put(sale_id, receipt)
+            receipts[sale_id] = receipt
+    return receipts
+
+def render_receipts_between(cursor, cache, start, end, limit):
+    """Receipts for every sale between two dates (inclusive), oldest first"""
+    cursor.execute("""
+        SELECT * FROM sales
+        WHERE created_at >= %s AND created_at < %s + INTERVAL 1 DAY
+        ORDER BY created_at, id
+        LIMIT %s
+    """, (start, end, limit))
+    sales = cursor.fetchall()
+
+    receipts = {}
+    missing = []
+    for sale in sales:
+        receipt = cache.get(sale['id'])
+        if receipt:
+            receipts[sale['id']] = receipt
+        else:
+            missing.append(sale)
+
+    for sale_id, receipt in _attach_items(cursor, missing).items():
+        cache.put(sale_id, receipt)
+        receipts[sale_id] = receipt
+    return [receipts[s['id']] for s in sales]
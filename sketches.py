@@ -0,0 +1,232 @@
+"""
+Streaming top-k ("heavy hitter") tracking for best-selling products.
+
+Quantities sold are kept per hourly bucket in a Space-Saving summary (Metwally
+et al.): at most `capacity` counters per bucket, each reported count is an
+over-estimate by at most its `error`, and any product that sold more than
+N / capacity units in the window is guaranteed to be present. Windows (hour,
+today, day, 7d, 30d) are answered by merging buckets: the closed hours of a
+window are merged once per hour (late lines are added to that merge), and a
+read only folds in the live hour. Setting exact=True keeps plain Counters
+instead, for validating the sketch against the SQL answer.
+
+Each gunicorn worker keeps its own tracker. create_sale records its own lines
+immediately; lines sold through other workers are picked up by tailing
+sale_items by id (at most every `refresh_seconds`) so all workers converge.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+WINDOWS = {
+    'hour': None,   # current clock hour
+    'today': None,  # since midnight
+    'day': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+}
+RETENTION = timedelta(days=31)
+
+
+def hour_of(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def window_start(window, now=None):
+    """First moment (inclusive) covered by a window"""
+    now = now or datetime.now()
+    if window == 'hour':
+        return hour_of(now)
+    if window == 'today':
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return hour_of(now - WINDOWS[window]) + timedelta(hours=1)
+
+
+class SpaceSaving:
+    """Space-Saving summary: {item: [count, error]} with at most `capacity` entries"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}
+        self.total = 0
+
+    def update(self, item, amount=1):
+        self.total += amount
+        if item in self.counters:
+            self.counters[item][0] += amount
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [amount, 0]
+        else:
+            # Replace the smallest counter; its count becomes our error bound
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + amount, floor]
+
+    def min_count(self):
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(c for c, _ in self.counters.values())
+
+    def merge(self, other):
+        """Combine two summaries (mergeable-summaries rule, Agarwal et al.)"""
+        merged = SpaceSaving(self.capacity)
+        merged.total = self.total + other.total
+        mine, theirs = self.min_count(), other.min_count()
+        for item in set(self.counters) | set(other.counters):
+            c1, e1 = self.counters.get(item, (mine, mine))
+            c2, e2 = other.counters.get(item, (theirs, theirs))
+            merged.counters[item] = [c1 + c2, e1 + e2]
+        if len(merged.counters) > self.capacity:
+            keep = sorted(merged.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:self.capacity]
+            merged.counters = dict(keep)
+        return merged
+
+    def top(self, k):
+        ranked = sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:k]
+        return [{'product_id': item, 'count': c, 'error': e} for item, (c, e) in ranked]
+
+    def error_bound(self):
+        """No count in this summary is off by more than this"""
+        return self.total // self.capacity if self.capacity else self.total
+
+
+class ExactCounter:
+    """Same interface as SpaceSaving but exact (unbounded memory)"""
+
+    def __init__(self, capacity=None):
+        self.counters = Counter()
+        self.total = 0
+
+    def update(self, item, amount=1):
+        self.total += amount
+        self.counters[item] += amount
+
+    def merge(self, other):
+        merged = ExactCounter()
+        merged.total = self.total + other.total
+        merged.counters = self.counters + other.counters
+        return merged
+
+    def top(self, k):
+        return [{'product_id': item, 'count': c, 'error': 0} for item, c in self.counters.most_common(k)]
+
+    def error_bound(self):
+        return 0
+
+
+class TopKTracker:
+    def __init__(self, capacity=64, exact=False, refresh_seconds=5, tail_overlap=1000):
+        self.capacity = capacity
+        self.summary_class = ExactCounter if exact else SpaceSaving
+        self.refresh_seconds = refresh_seconds
+        self.tail_overlap = tail_overlap
+        self.buckets = {}
+        self.max_id = None
+        self.seen = set()  # recent sale_item ids, so overlapping tails never double count
+        self.last_refresh = 0.0
+        # (window, start, live hour) -> merged summary of the window's closed hours
+        self._closed = {}
+        self._lock = threading.Lock()
+
+    # ---------- WRITING ----------
+    def _add(self, item_id, product_id, quantity, sold_at):
+        if item_id in self.seen:
+            return
+        self.seen.add(item_id)
+        hour = hour_of(sold_at)
+        if hour not in self.buckets:
+            self.buckets[hour] = self.summary_class(self.capacity)
+        self.buckets[hour].update(product_id, quantity)
+        # Late lines for a closed hour go straight into the pre-merged windows
+        for (_, start, live_hour), merged in self._closed.items():
+            if start <= hour < live_hour:
+                merged.update(product_id, quantity)
+
+    def record(self, item_id, product_id, quantity, sold_at):
+        """Called by create_sale after commit"""
+        with self._lock:
+            if self.max_id is None:
+                return  # not hydrated yet; the first refresh will count it
+            self._add(item_id, product_id, quantity, sold_at)
+
+    # ---------- SYNC WITH DATABASE ----------
+    def _hydrate(self, cursor):
+        since = hour_of(datetime.now() - RETENTION)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) as max_id FROM sale_items")
+        max_id = cursor.fetchone()['max_id']
+        cursor.execute("""
+            SELECT product_id, DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:00:00') as hour,
+                   SUM(quantity) as qty
+            FROM sale_items
+            WHERE created_at >= %s AND id <= %s
+            GROUP BY hour, product_id
+        """, (since, max_id))
+        for row in cursor.fetchall():
+            hour = datetime.strptime(row['hour'], '%Y-%m-%d %H:%M:%S')
+            if hour not in self.buckets:
+                self.buckets[hour] = self.summary_class(self.capacity)
+            self.buckets[hour].update(row['product_id'], int(row['qty']))
+
+        cursor.execute("SELECT id FROM sale_items WHERE id > %s AND id <= %s AND created_at >= %s",
+                       (max_id - self.tail_overlap, max_id, since))
+        self.seen.update(row['id'] for row in cursor.fetchall())
+        self.max_id = max_id
+
+    def _tail(self, cursor):
+        since = hour_of(datetime.now() - RETENTION)
+        cursor.execute("""
+            SELECT id, product_id, quantity, created_at
+            FROM sale_items
+            WHERE id > %s AND created_at >= %s
+            ORDER BY id
+        """, (self.max_id - self.tail_overlap, since))
+        for row in cursor.fetchall():
+            self._add(row['id'], row['product_id'], int(row['quantity']), row['created_at'])
+            self.max_id = max(self.max_id, row['id'])
+        self.seen = {i for i in self.seen if i > self.max_id - self.tail_overlap}
+
+    def refresh(self, cursor, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self.last_refresh < self.refresh_seconds:
+                return
+            if self.max_id is None:
+                self._hydrate(cursor)
+            else:
+                self._tail(cursor)
+            cutoff = hour_of(datetime.now() - RETENTION)
+            for hour in [h for h in self.buckets if h < cutoff]:
+                del self.buckets[hour]
+            self.last_refresh = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self.buckets.clear()
+            self.seen.clear()
+            self._closed.clear()
+            self.max_id = None
+
+    # ---------- READING ----------
+    def summary(self, window, now=None):
+        """Closed hours are merged once per window and hour; each read only folds in the live hour"""
+        now = now or datetime.now()
+        start, live_hour = window_start(window, now), hour_of(now)
+        with self._lock:
+            key = (window, start, live_hour)
+            if key not in self._closed:
+                self._closed = {k: v for k, v in self._closed.items() if k[2] == live_hour}
+                closed = self.summary_class(self.capacity)
+                for hour, bucket in self.buckets.items():
+                    if start <= hour < live_hour:
+                        closed = closed.merge(bucket)
+                self._closed[key] = closed
+            merged = self._closed[key].merge(self.summary_class(self.capacity))
+            for hour, bucket in self.buckets.items():
+                if hour >= live_hour:
+                    merged = merged.merge(bucket)
+            return merged
+
+    def top(self, window, k, now=None):
+        """[{'product_id', 'count', 'error'}], plus the window-wide error bound.
+        Pass the database's now: buckets are keyed by sale_items.created_at"""
+        merged = self.summary(window, now)
+        return merged.top(k), merged.error_bound()
@@ -0,0 +1,182 @@
+"""
+Bulk stocktake: apply a whole count sheet in one request.
+
+The sheet is loaded into a temporary table with multi-row INSERTs, then
+everything else is set-wise, so the query count does not grow with the
+number of SKUs:
+
+    1. INSERT ... SELECT diffs the sheet against products.stock_quantity and
+       records every counted line (expected, counted, reason) in
+       stock_adjustments under one stocktakes row
+    2. one UPDATE sets stock_quantity = counted where they differ
+    3. three statements resolve, refresh and open low-stock alerts
+    4. two SELECTs build the variance report
+
+mode='partial' only touches products on the sheet; mode='full' treats every
+product missing from the sheet as counted zero. dry_run=True returns the same
+report and rolls back.
+"""
+
+SHEET_BATCH_SIZE = 500  # rows per multi-row INSERT into the temporary sheet
+MODES = ('partial', 'full')
+
+
+class StocktakeError(ValueError):
+    """Bad count sheet; the message is safe to show to the user"""
+
+
+# ---------- SHEET ----------
+def parse_sheet(lines, max_lines):
+    """[{'id', 'counted', 'reason'?}] -> {product_id: (counted, reason)}; repeated ids are summed"""
+    if not isinstance(lines, list) or not lines:
+        raise StocktakeError("counts must be a non-empty list of {id, counted}")
+    if len(lines) > max_lines:
+        raise StocktakeError(f"at most {max_lines} lines per stocktake")
+
+    sheet = {}
+    for n, line in enumerate(lines, 1):
+        if not isinstance(line, dict):
+            raise StocktakeError(f"line {n}: expected an object with id and counted")
+        product_id, counted = line.get('id'), line.get('counted')
+        # bool is an int subclass; 2.9 or "3" must not be silently truncated
+        if not all(isinstance(v, int) and not isinstance(v, bool) for v in (product_id, counted)):
+            raise StocktakeError(f"line {n}: id and counted must be integers")
+        if counted < 0:
+            raise StocktakeError(f"line {n}: counted cannot be negative")
+        reason = line.get('reason')
+        if reason is not None and not isinstance(reason, str):
+            raise StocktakeError(f"line {n}: reason must be text")
+        reason = (reason or '').strip()[:255] or None
+        # Same SKU counted in two places (shelf + backroom) adds up
+        previous, previous_reason = sheet.get(product_id, (0, None))
+        sheet[product_id] = (previous + counted, previous_reason or reason)
+    return sheet
+
+def _load_sheet(cursor, sheet):
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS stocktake_sheet")
+    cursor.execute("""
+        CREATE TEMPORARY TABLE stocktake_sheet (
+            product_id INT PRIMARY KEY,
+            counted INT NOT NULL,
+            reason VARCHAR(255) NULL
+        )
+    """)
+    rows = [(pid, counted, reason) for pid, (counted, reason) in sheet.items()]
+    for i in range(0, len(rows), SHEET_BATCH_SIZE):
+        batch = rows[i:i + SHEET_BATCH_SIZE]
+        cursor.execute("INSERT INTO stocktake_sheet (product_id, counted, reason) VALUES "
+                       + ', '.join(['(%s, %s, %s)'] * len(batch)),
+                       tuple(value for row in batch for value in row))
+
+
+# ---------- APPLY ----------
+def _record_adjustments(cursor, stocktake_id, mode, reason):
+    """Diff sheet vs current stock in one statement (rows are read under lock on MySQL)"""
+    source = ("products p LEFT JOIN stocktake_sheet s ON s.product_id = p.id" if mode == 'full'
+              else "products p JOIN stocktake_sheet s ON s.product_id = p.id")
+    cursor.execute(f"""
+        INSERT INTO stock_adjustments (stocktake_id, product_id, expected, counted, reason)
+        SELECT %s, p.id, p.stock_quantity, COALESCE(s.counted, 0),
+               COALESCE(s.reason, %s)
+        FROM {source}
+    """, (stocktake_id, reason))
+
+def _apply_counts(cursor, stocktake_id):
+    cursor.execute("""
+        UPDATE products
+        SET stock_quantity = (SELECT a.counted FROM stock_adjustments a
+                              WHERE a.stocktake_id = %s AND a.product_id = products.id),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (SELECT product_id FROM stock_adjustments
+                     WHERE stocktake_id = %s AND counted <> expected)
+    """, (stocktake_id, stocktake_id))
+    return cursor.rowcount
+
+def _reevaluate_alerts(cursor, stocktake_id):
+    """Same rules as update_stock, for every counted product at once"""
+    counted = "SELECT product_id FROM stock_adjustments WHERE stocktake_id = %s"
+    low_stock_msg = "CONCAT('Low stock: ', p.stock_quantity, ' units (min: ', p.min_stock_level, ')')"
+
+    # Enough stock now: resolve
+    cursor.execute(f"""
+        UPDATE alerts SET is_resolved = TRUE
+        WHERE is_resolved = FALSE
+        AND product_id IN (SELECT p.id FROM products p
+                           WHERE p.id IN ({counted}) AND p.stock_quantity > p.min_stock_level)
+    """, (stocktake_id,))
+    # Still low: refresh the open alert's numbers
+    cursor.execute(f"""
+        UPDATE alerts
+        SET message = (SELECT {low_stock_msg} FROM products p WHERE p.id = alerts.product_id)
+        WHERE is_resolved = FALSE
+        AND product_id IN (SELECT p.id FROM products p
+                           WHERE p.id IN ({counted}) AND p.stock_quantity <= p.min_stock_level)
+    """, (stocktake_id,))
+    # Newly low: open an alert
+    cursor.execute(f"""
+        INSERT INTO alerts (product_id, message)
+        SELECT p.id, {low_stock_msg}
+        FROM stock_adjustments a
+        JOIN products p ON p.id = a.product_id
+        LEFT JOIN alerts al ON al.product_id = p.id AND al.is_resolved = FALSE
+        WHERE a.stocktake_id = %s AND p.stock_quantity <= p.min_stock_level AND al.id IS NULL
+    """, (stocktake_id,))
+
+
+# ---------- REPORT ----------
+def variance_report(cursor, stocktake_id):
+    cursor.execute("""
+        SELECT COUNT(*) as lines_counted,
+               COALESCE(SUM(counted <> expected), 0) as lines_adjusted,
+               COALESCE(SUM(CASE WHEN counted > expected THEN counted - expected ELSE 0 END), 0) as units_over,
+               COALESCE(SUM(CASE WHEN counted < expected THEN expected - counted ELSE 0 END), 0) as units_short,
+               COALESCE(SUM((counted - expected) * p.purchase_price), 0) as value_at_cost
+        FROM stock_adjustments a
+        JOIN products p ON p.id = a.product_id
+        WHERE a.stocktake_id = %s
+    """, (stocktake_id,))
+    totals = cursor.fetchone()
+
+    cursor.execute("""
+        SELECT a.product_id as id, p.name, a.expected, a.counted, a.counted - a.expected as variance,
+               (a.counted - a.expected) * p.purchase_price as value_at_cost, a.reason
+        FROM stock_adjustments a
+        JOIN products p ON p.id = a.product_id
+        WHERE a.stocktake_id = %s AND a.counted <> a.expected
+        ORDER BY ABS((a.counted - a.expected) * p.purchase_price) DESC, a.product_id
+    """, (stocktake_id,))
+    lines = cursor.fetchall()
+    for line in lines:
+        # Decimal -> float for jsonify
+        line['value_at_cost'] = round(float(line['value_at_cost']), 2)
+
+    return {
+        'lines_counted': int(totals['lines_counted']),
+        'lines_adjusted': int(totals['lines_adjusted']),
+        'units_over': int(totals['units_over']),
+        'units_short': int(totals['units_short']),
+        'value_at_cost': round(float(totals['value_at_cost']), 2),
+        'variances': lines,
+    }
+
+
+def run_stocktake(cursor, sheet, mode, reason, user_id):
+    """Everything except commit/rollback; returns the response body"""
+    _load_sheet(cursor, sheet)
+    cursor.execute("""
+        SELECT s.product_id FROM stocktake_sheet s
+        LEFT JOIN products p ON p.id = s.product_id
+        WHERE p.id IS NULL
+    """)
+    unknown = sorted(row['product_id'] for row in cursor.fetchall())
+
+    cursor.execute("INSERT INTO stocktakes (mode, reason, user_id) VALUES (%s, %s, %s)",
+                   (mode, reason, user_id))
+    stocktake_id = cursor.lastrowid
+    _record_adjustments(cursor, stocktake_id, mode, reason)
+    _apply_counts(cursor, stocktake_id)
+    _reevaluate_alerts(cursor, stocktake_id)
+    report = variance_report(cursor, stocktake_id)
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS stocktake_sheet")
+
+    return {'stocktake_id': stocktake_id, 'mode': mode, 'unknown_ids': unknown, **report}
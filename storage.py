@@ -0,0 +1,303 @@
+"""
+Storage backends behind the routes.
+
+DB_BACKEND=mysql (default) uses the remote MySQL through flask_mysqldb.
+DB_BACKEND=sqlite uses an embedded SQLite file (SQLITE_PATH) for single-till
+stores: WAL journal, pragmas tuned for small POS write transactions, one
+long-lived connection per thread so prepared statements are reused across
+requests, and a translator for the MySQL dialect the queries are written in
+(%s placeholders, CURDATE(), NOW(), CURRENT_TIMESTAMP, DATE_SUB / + INTERVAL, DATE_FORMAT,
+CONCAT, TIMESTAMPDIFF, INSERT IGNORE, FOR UPDATE SKIP LOCKED,
+DROP TEMPORARY TABLE).
+
+Routes and modules only use `db.cursor()`, `db.commit()`, `db.rollback()`
+(plus `db.detach()` / `db.attach()` to carry the connection into work that runs
+after the response); cursors always return dict rows.
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import click
+from flask import current_app
+from flask.globals import app_ctx
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations', 'sqlite_schema.sql')
+
+
+# ---------- MYSQL ----------
+class MySQLBackend:
+    dialect = 'mysql'
+
+    def __init__(self, app):
+        # 🔧 RAILWAY FIX: Use PyMySQL instead of native MySQL driver
+        import pymysql
+        pymysql.install_as_MySQLdb()
+        import MySQLdb.cursors
+        from flask_mysqldb import MySQL
+
+        self.cursor_class = MySQLdb.cursors.DictCursor
+        # Connections are opened lazily on first use of mysql.connection
+        self.mysql = MySQL(app)
+
+    @property
+    def connection(self):
+        return self.mysql.connection
+
+    def cursor(self):
+        return self.connection.cursor(self.cursor_class)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self):
+        self.connection.ping(True)
+
+    def detach(self):
+        """Take this app context's connection so its teardown leaves it open"""
+        return app_ctx._get_current_object().__dict__.pop('mysql_db', None)
+
+    def attach(self, conn):
+        """Hand a detached connection to the current app context (closed at its teardown)"""
+        if conn is not None:
+            app_ctx._get_current_object().mysql_db = conn
+
+
+# ---------- SQLITE ----------
+INTERVAL_UNITS = {'SECOND': 'seconds', 'MINUTE': 'minutes', 'HOUR': 'hours', 'DAY': 'days', 'MONTH': 'months'}
+DATE_FORMAT_CODES = {'%i': '%M', '%s': '%S', '%h': '%I', '%e': '%d', '%c': '%m'}
+WEEKDAY_SQL = "substr('SunMonTueWedThuFriSat', 1 + 3 * strftime('%w', {0}), 3)"
+
+
+def _split_args(text):
+    """Split a function's argument list on top-level commas"""
+    args, depth, quote, current = [], 0, None, ''
+    for ch in text:
+        if quote:
+            quote = None if ch == quote else quote
+        elif ch in "'\"":
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(current.strip())
+            current = ''
+            continue
+        current += ch
+    args.append(current.strip())
+    return args
+
+def _replace_calls(sql, name, render):
+    """Rewrite every NAME(...) call, handling nested parentheses"""
+    pattern = re.compile(rf'\b{name}\s*\(', re.IGNORECASE)
+    while True:
+        match = pattern.search(sql)
+        if not match:
+            return sql
+        depth, i = 1, match.end()
+        while depth:
+            depth += {'(': 1, ')': -1}.get(sql[i], 0)
+            i += 1
+        sql = sql[:match.start()] + render(_split_args(sql[match.end():i - 1])) + sql[i:]
+
+def _date_modifier(base, amount, unit, sign):
+    modifier = f"'{sign}' || {amount} || ' {INTERVAL_UNITS[unit.upper()]}'"
+    if base.upper() == 'CURDATE()':
+        return f"date('now', 'localtime', {modifier})"
+    if base.upper() == 'NOW()':
+        return f"datetime('now', 'localtime', {modifier})"
+    return f"datetime({base}, {modifier})"
+
+def _date_format(args):
+    column, fmt = args[0], args[1].strip("'")
+    if fmt == '%a':
+        return WEEKDAY_SQL.format(column)
+    for mysql_code, sqlite_code in DATE_FORMAT_CODES.items():
+        fmt = fmt.replace(mysql_code, sqlite_code)
+    return f"strftime('{fmt}', {column})"
+
+@lru_cache(maxsize=512)
+def translate(sql, has_params):
+    """MySQL-flavoured SQL -> SQLite. Cached so identical statements hit sqlite3's statement cache"""
+    if has_params:
+        sql = re.sub(r'%[s%]', lambda m: '?' if m.group() == '%s' else '%', sql)
+
+    sql = _replace_calls(sql, 'TIMESTAMPDIFF', lambda a: (
+        f"CAST(strftime('%s', {a[2]}) - strftime('%s', {a[1]}) AS INTEGER)"))
+    sql = _replace_calls(sql, 'DATE_SUB', lambda a: _date_modifier(
+        a[0], *re.match(r'INTERVAL\s+(.+)\s+(\w+)$', a[1], re.IGNORECASE).groups(), '-'))
+    sql = re.sub(r"(CURDATE\(\)|NOW\(\)|\?|[\w.]+)\s*\+\s*INTERVAL\s+(\([^)]*\)|\S+)\s+(SECOND|MINUTE|HOUR|DAY|MONTH)\b",
+                 lambda m: _date_modifier(m.group(1), m.group(2), m.group(3), '+'), sql, flags=re.IGNORECASE)
+    sql = _replace_calls(sql, 'DATE_FORMAT', _date_format)
+    sql = _replace_calls(sql, 'CONCAT', lambda a: '(' + ' || '.join(a) + ')')
+    sql = re.sub(r'\bCURDATE\(\)', "date('now', 'localtime')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bNOW\(\)|\bCURRENT_TIMESTAMP\b', "datetime('now', 'localtime')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bINSERT\s+IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bFOR\s+UPDATE(\s+SKIP\s+LOCKED)?', '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bDROP\s+TEMPORARY\s+TABLE\b', 'DROP TABLE', sql, flags=re.IGNORECASE)
+    return sql
+
+
+class SQLiteCursor:
+    """DB-API cursor that speaks the MySQL dialect used by the routes"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        if params is None:
+            return self._cursor.execute(translate(sql, False))
+        return self._cursor.execute(translate(sql, True), tuple(params))
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+sqlite3.register_adapter(datetime, lambda d: d.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter('DATETIME', _parse_datetime)
+sqlite3.register_converter('TIMESTAMP', _parse_datetime)
+sqlite3.register_converter('DATE', lambda v: date.fromisoformat(v.decode()))
+
+
+class SQLiteBackend:
+    dialect = 'sqlite'
+
+    PRAGMAS = [
+        'PRAGMA journal_mode = WAL',        # readers never block the till's writes
+        'PRAGMA synchronous = NORMAL',      # fsync at checkpoints only; safe with WAL
+        'PRAGMA busy_timeout = 5000',
+        'PRAGMA foreign_keys = ON',
+        'PRAGMA cache_size = -16000',       # 16 MB page cache
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA mmap_size = 134217728',
+        'PRAGMA wal_autocheckpoint = 1000',
+    ]
+
+    def __init__(self, app):
+        self.path = app.config['SQLITE_PATH']
+        self._local = threading.local()
+
+        @app.teardown_appcontext
+        def end_transaction(exc):
+            # Connections outlive requests (statement cache); never leak a transaction
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+
+    @property
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES,
+                                   cached_statements=512, timeout=5)
+            conn.row_factory = _dict_row
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            with open(SCHEMA_PATH) as f:
+                conn.executescript(f.read())
+            self._local.conn = conn
+        return conn
+
+    def cursor(self):
+        return SQLiteCursor(self.connection.cursor())
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self):
+        pass
+
+    def detach(self):
+        return None  # connections are per thread and outlive app contexts
+
+    def attach(self, conn):
+        pass
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
+
+
+# ---------- FACADE ----------
+class Storage:
+    """Module-level handle; the backend for the current app lives in app.extensions"""
+
+    def init_app(self, app):
+        app.extensions['storage'] = BACKENDS[app.config['DB_BACKEND']](app)
+        self._register_cli(app)
+
+    @property
+    def backend(self):
+        return current_app.extensions['storage']
+
+    @property
+    def dialect(self):
+        return self.backend.dialect
+
+    def cursor(self):
+        return self.backend.cursor()
+
+    def commit(self):
+        self.backend.commit()
+
+    def rollback(self):
+        self.backend.rollback()
+
+    def ping(self):
+        self.backend.ping()
+
+    def detach(self):
+        return self.backend.detach()
+
+    def attach(self, conn):
+        self.backend.attach(conn)
+
+    def _register_cli(self, app):
+        @app.cli.group('storage')
+        def storage_cli():
+            """Storage backend utilities."""
+
+        @storage_cli.command('create-user')
+        @click.argument('username')
+        @click.argument('password')
+        @click.option('--role', default='admin')
+        def create_user_command(username, password, role):
+            """Add a login (e.g. the first admin of a new SQLite store)."""
+            cursor = self.cursor()
+            cursor.execute("INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+                           (username, password, role))
+            self.commit()
+            click.echo(f"✅ User {username} created on {self.dialect}")
+
+
+db = Storage()